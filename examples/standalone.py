@@ -71,14 +71,9 @@ class MandelbrotBehaviour(nr.interface.Implementation):
         }
         ''')
 
-    glUseProgram(self.program)
-    glUniform1f(glGetUniformLocation(self.program, 'time'), self.node.scene.time)
-    glBegin(GL_TRIANGLE_STRIP)
-    glVertex2f(-1.0, -1.0)
-    glVertex2f(1.0, -1.0)
-    glVertex2f(-1.0, 1.0)
-    glVertex2f(1.0, 1.0)
-    glEnd()
+    self.program.use()
+    self.program.set_float('time', self.node.scene.time)
+    draw_fullscreen_quad()
 
 
 Mandelbrot = node_factory(MandelbrotBehaviour, 'mandel')
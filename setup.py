@@ -19,7 +19,8 @@ setuptools.setup(
   packages = setuptools.find_packages(),
   entry_points = {
     'console_scripts': [
-      'vizardry = vizardry.main:main'
+      'vizardry = vizardry.main:main',
+      'vizardry-render = vizardry.render:main'
     ]
   }
 )
@@ -20,7 +20,9 @@
 # IN THE SOFTWARE.
 
 from nose.tools import *
-from vizardry.core.generics.eventhandler import EventHandler
+import threading
+from vizardry.core.generics.eventhandler import EventHandler, EventQueue, EventStats
+from vizardry.core.generics.lrucache import LRUCache
 from vizardry.core.generics.treenode import TreeNode
 from vizardry.core.generics.network import Network, NetworkNode, \
   NodeNameConflictError, NodeNameInvalidError
@@ -103,3 +105,165 @@ def test_Network():
   with assert_raises(RuntimeError):
     node1.attach_to(network2.root)  # must be part of the same network
   assert_equals(node1.parent, network.root)  # not detached after failed attach_to()
+
+
+def test_EventHandler_dispatch():
+  events = []
+  handler = EventHandler()
+  assert_false(handler.has_listeners('event'))
+  handler.bind(None, events.append)
+  assert_true(handler.has_listeners('event'))
+
+  event = handler.event_class('event')
+  handler.dispatch(event)
+  assert_equals(events, [event])
+
+
+def test_EventQueue():
+  events = []
+  queue = EventQueue()
+  handler = EventHandler(queue=queue)
+  handler.bind('event', events.append)
+
+  handler.emit('event', 1, 'source1')
+  handler.emit('event', 2, 'source2')
+  handler.emit('event', 3, 'source1')
+  assert_equals(events, [])
+  assert_equals(len(queue), 2)
+
+  assert_equals(queue.flush(), 2)
+  assert_equals([(ev.data, ev.source) for ev in events], [(3, 'source1'), (2, 'source2')])
+  assert_equals(len(queue), 0)
+
+  queue.active = False
+  handler.emit('event', 4)
+  assert_equals(events[-1].data, 4)
+
+
+def test_EventQueue_threads():
+  events = []
+  queue = EventQueue(active=False, maxsize=2, overflow=EventQueue.DROP)
+  handler = EventHandler(queue=queue)
+  handler.bind(None, events.append)
+
+  def worker():
+    for i in range(4):
+      handler.emit('event{}'.format(i))
+  thread = threading.Thread(target=worker)
+  thread.start()
+  thread.join()
+
+  # Events from other threads are queued even if the queue is inactive.
+  assert_equals(events, [])
+  assert_equals(queue.dropped, 2)
+  assert_equals(queue.flush(limit=1), 1)
+  assert_equals([ev.kind for ev in events], ['event0'])
+  assert_equals(queue.flush(), 1)
+  assert_equals([ev.kind for ev in events], ['event0', 'event1'])
+
+  queue.overflow = EventQueue.MERGE
+  def worker():
+    for i in range(4):
+      handler.emit('event{}'.format(i % 2), i, source=i)
+  thread = threading.Thread(target=worker)
+  thread.start()
+  thread.join()
+  assert_equals(queue.dropped, 2)
+  queue.flush()
+  assert_equals([ev.data for ev in events[2:]], [2, 3])
+
+  queue.overflow = EventQueue.BLOCK
+  thread = threading.Thread(target=worker)
+  thread.start()
+  while thread.is_alive() or len(queue):
+    queue.flush()
+  thread.join()
+  assert_equals([ev.data for ev in events[4:]], [0, 1, 2, 3])
+
+
+def test_EventHandler_weak():
+  events = []
+  class Panel:
+    def on_event(self, event):
+      events.append(event)
+
+  panel = Panel()
+  handler = EventHandler()
+  weak_listener = handler.bind('event', panel.on_event, weak=True)
+  listener = handler.bind('event', events.append)
+  handler.emit('event')
+  assert_equals(len(events), 2)
+
+  del panel
+  assert_equals(list(handler.listeners['event']), [listener])
+  handler.emit('event')
+  assert_equals(len(events), 3)
+
+  handler.unbind('event', listener)
+  assert_false(handler.has_listeners('event'))
+  with assert_raises(ValueError):
+    handler.unbind('event', listener)
+
+
+def test_EventStats():
+  def listener(event):
+    pass
+
+  stats = EventStats()
+  handler1 = EventHandler()
+  handler2 = EventHandler()
+  handler1.stats = handler2.stats = stats
+  handler1.bind('event', listener)
+  handler1.bind(None, listener)
+  handler2.bind('event', listener)
+
+  event = handler1.event_class('event')
+  handler1.dispatch(event)
+  handler2.dispatch(event)
+  handler1.emit('other')
+
+  assert_equals(stats.kinds['event'].events, 1)
+  assert_equals(stats.kinds['event'].calls, 3)
+  assert_equals(stats.kinds['event'].max_fanout, 3)
+  assert_equals(stats.kinds['other'].events, 1)
+  assert_equals(stats.kinds['other'].calls, 1)
+
+  (kind, name), listener_stats = stats.top_listeners(1, key='calls')[0]
+  assert_equals(kind, 'event')
+  assert_true(name.endswith('test_EventStats.<locals>.listener'))
+  assert_equals(listener_stats.calls, 3)
+  assert_true(stats.format())
+
+  # Listeners that are filtered out are not counted.
+  stats.reset()
+  handler2.bind('event', listener, filter=lambda ev: ev.data)
+  handler2.emit('event', data=False)
+  assert_equals(stats.kinds['event'].events, 1)
+  assert_equals(stats.kinds['event'].calls, 1)
+  assert_equals(stats.kinds['event'].max_fanout, 1)
+  handler2.emit('event', data=True)
+  assert_equals(stats.kinds['event'].calls, 3)
+  assert_equals(stats.kinds['event'].max_fanout, 2)
+
+
+def test_LRUCache():
+  evicted = []
+  cache = LRUCache(2, evicted.append)
+  cache.put('a', 1)
+  cache.put('b', 2)
+  assert_equals(cache.get('a'), 1)
+  cache.put('c', 3)
+  assert_equals(evicted, [2])
+  assert_equals(list(cache), ['a', 'c'])
+  assert_equals(cache.get('b', 0), 0)
+
+  assert_true(cache.evict('a'))
+  assert_false(cache.evict('a'))
+  assert_equals(evicted, [2, 1])
+  assert_equals(cache.pop('c'), 3)
+  assert_equals(evicted, [2, 1])
+  assert_equals(len(cache), 0)
+
+  cache.put('d', 4)
+  cache.clear()
+  assert_equals(evicted, [2, 1, 4])
@@ -0,0 +1,384 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+from nose.tools import *
+from vizardry.gl.binarycache import ProgramBinaryCache, driver_info
+from vizardry import gl
+from vizardry.gl.api import *
+from OpenGL import contextdata
+from OpenGL.error import GLError as GLErrorBase
+from vizardry.gl.oop import DeletionQueue, ResourceManager, Shader, pixel_format
+
+import contextlib
+import numpy
+import os
+import tempfile
+import threading
+
+
+@contextlib.contextmanager
+def program_binary_cache(cache):
+  """
+  Sets the #Program.binary_cache and restores the previous value on exit.
+  """
+
+  previous = gl.Program.binary_cache
+  gl.Program.binary_cache = cache
+  try:
+    yield cache
+  finally:
+    gl.Program.binary_cache = previous
+
+
+def test_ProgramBinaryCache():
+  driver = ('Vendor', 'Renderer', '4.5')
+  sources = [(0x8B31, 'void main() {}'), (0x8B30, 'void main() {}')]
+  key = ProgramBinaryCache.make_key(sources, driver)
+  assert_equals(key, ProgramBinaryCache.make_key(sources, driver))
+  assert_not_equals(key, ProgramBinaryCache.make_key(sources, driver[:2] + ('4.6',)))
+  assert_not_equals(key, ProgramBinaryCache.make_key(sources[::-1], driver))
+
+  with tempfile.TemporaryDirectory() as directory:
+    cache = ProgramBinaryCache(os.path.join(directory, 'programs'))
+    assert_equals(cache.load(key), None)
+    assert_true(cache.store(key, 0x1234, b'binary data'))
+    assert_equals(cache.load(key), (0x1234, b'binary data'))
+    assert_equals(os.listdir(cache.directory), [key + '.bin'])
+
+    with open(cache.filename(key), 'wb') as fp:
+      fp.write(b'garbage')
+    assert_equals(cache.load(key), None)
+    cache.remove(key)
+    assert_equals(cache.load(key), None)
+
+
+def test_DeletionQueue():
+  deleted = []
+  class Handle:
+    @staticmethod
+    def _delete(handles):
+      deleted.append(handles)
+
+  assert_false(DeletionQueue.is_deferring())
+  with DeletionQueue.deferring():
+    assert_true(DeletionQueue.is_deferring())
+    thread = threading.Thread(target=lambda: deleted.append(DeletionQueue.is_deferring()))
+    thread.start()
+    thread.join()
+  assert_equals(deleted, [False])
+
+  del deleted[:]
+  queue = DeletionQueue()
+  queue.add(Handle, 1)
+  queue.add(Handle, 2)
+  assert_equals(len(queue), 2)
+  assert_equals(queue.flush(), 2)
+  assert_equals(deleted, [[1, 2]])
+  assert_equals(len(queue), 0)
+
+
+def test_DeletionQueue_threads():
+  with gl.Recorder() as recorder:
+    context = contextdata.getContext()
+    manager = gl.ResourceManager()
+    with manager.as_current(release=False):
+      texture1 = gl.Texture(4, 4)
+      texture2 = gl.Texture(4, 4)
+
+    # Released from a thread where the context is not current.
+    thread = threading.Thread(target=manager.release)
+    thread.start()
+    thread.join()
+    assert_false(texture1)
+    assert_equals(recorder.count('glDeleteTextures'), 0)
+    assert_equals(len(DeletionQueue.of(context)), 2)
+    assert_true(DeletionQueue.current() is DeletionQueue.of(context))
+
+    # Handles of another context are queued for that context.
+    with manager.as_current(release=False):
+      texture = gl.Texture(4, 4)
+    texture._context = 'other'
+    texture.release()
+    assert_equals(len(DeletionQueue.of('other')), 1)
+    contextdata.cleanupContext('other')
+
+    assert_equals(DeletionQueue.flush_current(), 2)
+    assert_equals(recorder.count('glDeleteTextures'), 1)
+
+
+def test_ResourceManager_types():
+  class CustomShader(Shader):
+    pass
+
+  manager = ResourceManager()
+  assert_true(manager.Shader is manager.Shader)
+  assert_true(manager.Shader._cls is Shader)
+  assert_true(manager.CustomShader._cls is CustomShader)
+  assert_true(manager.Shader.cached is manager.Shader.cached)
+  with assert_raises(AttributeError):
+    manager.NoSuchHandle
+
+
+def test_ResourceManager_proxy():
+  with gl.Recorder() as recorder:
+    manager = ResourceManager()
+    texture = manager.Texture(4, 4)
+    assert_true(texture.resource_manager is manager)
+    assert_true(ResourceManager.current is None)
+
+    other = ResourceManager()
+    with other.as_current():
+      buffer = manager.Buffer(16)
+      assert_true(ResourceManager.current is other)
+    assert_true(buffer)
+    assert_equals(recorder.count('glDeleteBuffers'), 0)
+
+    manager.release()
+    assert_false(texture)
+    assert_false(buffer)
+    assert_equals(recorder.count('glDeleteBuffers'), 1)
+
+
+def test_pixel_format():
+  assert_equals(pixel_format(numpy.zeros((4, 8, 4), numpy.uint8)), (GL_RGBA, GL_UNSIGNED_BYTE))
+  assert_equals(pixel_format(numpy.zeros((4, 8), numpy.float32)), (GL_RED, GL_FLOAT))
+  assert_equals(pixel_format(numpy.zeros((4, 8, 3), numpy.float16)), (GL_RGB, GL_HALF_FLOAT))
+  with assert_raises(ValueError):
+    pixel_format(numpy.zeros((4, 8, 5), numpy.uint8))
+  with assert_raises(ValueError):
+    pixel_format(numpy.zeros((4, 8), numpy.int64))
+
+
+def test_Program_cached():
+  with program_binary_cache(None), gl.Recorder() as recorder:
+    manager1 = gl.ResourceManager()
+    manager2 = gl.ResourceManager()
+    with manager1.as_current(release=False):
+      program1 = gl.Program.from_fragment('void main() {}')
+      program2 = gl.Program.from_fragment('void main() { }')
+    with manager2.as_current(release=False):
+      program3 = gl.Program.from_fragment('void main() {}')
+
+    # The vertex shader and the first program are shared.
+    assert_true(program1 is program3)
+    assert_false(program1 is program2)
+    assert_equals(recorder.count('glCompileShader'), 3)
+    assert_equals(recorder.count('glLinkProgram'), 2)
+
+    manager1.release()
+    assert_equals(recorder.count('glDeleteProgram'), 1)
+    assert_true(program1)
+    assert_false(program2)
+    manager2.release()
+    assert_equals(recorder.count('glDeleteProgram'), 2)
+    assert_false(program1)
+
+
+def test_Program_cached_stale_binary():
+  rejected = []
+  def program_binary(program, binary_format, binary, length):
+    rejected.append(binary)
+    raise GLErrorBase(GL_INVALID_ENUM, None)
+  sources = [(GL_VERTEX_SHADER, 'void main() {}'), (GL_FRAGMENT_SHADER, 'void main() {}')]
+
+  with tempfile.TemporaryDirectory() as directory:
+    cache = ProgramBinaryCache(directory)
+    with program_binary_cache(cache), gl.Recorder() as recorder:
+      recorder.returns['glGetIntegerv'] = lambda pname: 1
+      recorder.returns['glProgramBinary'] = program_binary
+      key = cache.make_key(sources, driver_info())
+      assert_true(cache.store(key, 0x1234, b'foreign binary'))
+      with gl.ResourceManager().as_current():
+        program = gl.Program.cached(*sources)
+        assert_true(program)
+      assert_equals(rejected, [b'foreign binary'])
+      assert_equals(recorder.count('glLinkProgram'), 1)
+      assert_not_equal(cache.load(key), (0x1234, b'foreign binary'))
+
+
+def test_Program_uniforms():
+  with program_binary_cache(None), gl.Recorder() as recorder:
+    recorder.returns['glGetProgramiv'] = lambda p, pname: 1
+    recorder.returns['glGetActiveUniform'] = lambda p, index: (b'time', 1, GL_FLOAT)
+    recorder.returns['glGetUniformLocation'] = lambda p, name: 3
+    with gl.ResourceManager().as_current():
+      program = gl.Program()
+      program.link()
+      assert_equals(program.uniforms, {'time': 3})
+      assert_true(program.set_float('time', 1.0))
+      assert_false(program.set_float('time', 1.0))
+      assert_false(program.set_float('other', 1.0))
+      assert_equals(recorder.count('glUniform1f'), 1)
+      assert_equals(recorder.count('glGetUniformLocation'), 1)
+
+
+def test_ResourcePool():
+  with gl.Recorder() as recorder:
+    manager = gl.ResourceManager()
+    with manager.as_current(release=False):
+      texture = gl.Texture.pooled(16, 16)
+    manager.release()
+    assert_equals(recorder.count('glDeleteTextures'), 0)
+    with manager.as_current(release=False):
+      assert_true(gl.Texture.pooled(16, 16) is texture)
+      assert_false(gl.Texture.pooled(16, 16) is texture)
+    assert_equals(recorder.count('glGenTextures'), 2)
+
+    with gl.DeletionQueue.deferring():
+      gl.ResourcePool.current().clear()
+      manager.release()  # both textures return to the pool
+      gl.ResourcePool.current().clear()
+    assert_equals(recorder.count('glDeleteTextures'), 0)
+    gl.DeletionQueue.flush_current()
+    assert_equals(recorder.count('glDeleteTextures'), 1)
+
+
+def test_StateTracker():
+  with gl.Recorder() as recorder:
+    state = gl.current_state()
+    state.use_program(1)
+    state.use_program(1)
+    state.bind_texture(0, GL_TEXTURE_2D, 5)
+    state.bind_texture(0, GL_TEXTURE_2D, 5)
+    state.bind_texture(1, GL_TEXTURE_2D, 5)
+    state.forget('texture', [5])
+    state.bind_texture(1, GL_TEXTURE_2D, 5)
+    assert_equals(recorder.names(), ['glUseProgram', 'glActiveTexture',
+      'glBindTexture', 'glActiveTexture', 'glBindTexture', 'glBindTexture'])
+    assert_equals((state.issued, state.skipped), (6, 3))
+
+
+def test_StateTracker_element_buffer():
+  with gl.Recorder() as recorder:
+    state = gl.current_state()
+    assert_true(gl.current_state(create=False) is state)
+
+    # Not shadowed while the vertex array is unknown.
+    state.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, 7)
+    state.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, 7)
+    assert_equals(recorder.count('glBindBuffer'), 2)
+
+    # The binding belongs to the vertex array.
+    state.bind_vertex_array(1)
+    state.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, 7)
+    state.bind_vertex_array(2)
+    state.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, 7)
+    state.bind_vertex_array(1)
+    assert_false(state.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, 7))
+    assert_equals(recorder.count('glBindBuffer'), 4)
+
+    state.forget('vertex_array', [1])
+    state.bind_vertex_array(1)
+    assert_true(state.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, 7))
+    state.forget('buffer', [7])
+    assert_true(state.bind_buffer(GL_ELEMENT_ARRAY_BUFFER, 7))
+  assert_equals(gl.current_state(create=False), None)
+
+
+def test_RenderQueue():
+  with program_binary_cache(None), gl.Recorder() as recorder:
+    with gl.ResourceManager().as_current():
+      program1 = gl.Program.from_fragment('void main() {}')
+      program2 = gl.Program.from_fragment('void main() { }')
+      geometry = gl.Geometry(1, 3, instance_location=1)
+      queue = gl.RenderQueue.current()
+      for i in range(6):
+        queue.submit(program1 if i % 2 else program2, geometry, instance=(i,))
+      queue.submit(program1, geometry)
+      queue.submit(program2, geometry, layer=-1)
+
+      batches = queue.batches()
+      assert_equals([len(x) for x in batches], [1, 3, 1, 3])
+      assert_true(batches[0][0].layer == -1)
+      assert_equals([x.instance for x in batches[1]],
+        [(1.0, 0.0, 0.0, 1.0), (3.0, 0.0, 0.0, 1.0), (5.0, 0.0, 0.0, 1.0)])
+
+      recorder.clear()
+      assert_equals(queue.flush(), 4)
+      assert_equals(len(queue), 0)
+      assert_equals(recorder.count('glUseProgram'), 3)
+      assert_equals(recorder.count('glDrawArrays'), 2)
+      assert_equals(recorder.count('glDrawArraysInstanced'), 2)
+      assert_equals(recorder.count('glBufferSubData'), 1)
+
+      # Items that share the vertex array but not the geometry, or that
+      # are not instanced, must not split the batches of the others.
+      points = gl.Geometry(1, 1, GL_POINTS, instance_location=1)
+      for i in range(3):
+        queue.submit(program1, geometry, instance=(i,))
+        queue.submit(program1, points, instance=(i,))
+        queue.submit(program1, geometry)
+      assert_equals(sorted(len(x) for x in queue.batches()), [1, 1, 1, 3, 3])
+      queue.clear()
+      gl.RenderQueue.release_current()
+
+
+def test_RenderCache():
+  with program_binary_cache(None), gl.Recorder() as recorder:
+    viewport = numpy.array([0, 0, 64, 32], numpy.int32)
+    recorder.returns['glGetIntegerv'] = lambda pname: viewport if pname == GL_VIEWPORT else 0
+    cache = gl.RenderCache()
+    with gl.ResourceManager().as_current():
+      program = gl.Program.from_fragment('void main() {}')
+      geometry = gl.Geometry(1, 3)
+      queue = gl.RenderQueue.current()
+      queue.submit(program, geometry, layer=1)
+      render = lambda: queue.submit(program, geometry)
+
+      cache.draw(1, render)
+      cache.draw(1, render)
+      assert_equals(cache.renders, 1)
+      cache.draw(2, render)
+      viewport[2:] = (32, 32)
+      cache.draw(2, render)
+      assert_equals(cache.target.width, 32)
+      assert_equals(cache.renders, 3)
+
+      # Items submitted by the render function were drawn into the cache,
+      # the item submitted before is still queued.
+      assert_equals(recorder.count('glDrawArrays'), 4 + 3)
+      assert_equals(len(queue), 1)
+      assert_equals(queue.batches()[0][0].layer, 1)
+      queue.clear()
+    cache.release()
+    gl.FullscreenQuad.release_current()
+
+
+def test_TextureStream():
+  with gl.Recorder() as recorder:
+    with gl.ResourceManager().as_current():
+      texture = gl.Texture(4, 4)
+      stream = gl.TextureStream(texture, count=2)
+      array = numpy.zeros((4, 4, 4), numpy.uint8)
+      stream.upload(array)
+      stream.upload(array)
+      assert_equals(recorder.count('glClientWaitSync'), 0)
+
+      # The first buffer is only written again after its transfer finished.
+      recorder.clear()
+      stream.upload(array)
+      names = [x for x in recorder.names() if x in ('glClientWaitSync',
+        'glDeleteSync', 'glMapBufferRange', 'glFenceSync')]
+      assert_equals(names, ['glClientWaitSync', 'glDeleteSync',
+        'glMapBufferRange', 'glFenceSync'])
+      stream.release()
+      assert_equals(recorder.count('glDeleteSync'), 3)
@@ -0,0 +1,61 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+from nose.tools import *
+from vizardry.behaviours.glinline import GLInline, compile_code
+from vizardry.core.scene import Scene
+
+
+def test_compile_code():
+  source = 'x = 1\ndef f():\n  return x\n'
+  compiled = compile_code(source, 'test')
+  assert_true(compile_code(source, 'test') is compiled)
+  assert_equals(compiled.def_names, {'f'})
+
+  other = compile_code('x = 1\ndef f():\n  return x + 1\n', 'test')
+  assert_equals(other.state, compiled.state)
+  other = compile_code('x = 2\ndef f():\n  return x\n', 'test')
+  assert_not_equals(other.state, compiled.state)
+
+
+def test_GLInline_hot_reload():
+  scene = Scene()
+  node = GLInline(scene, hot_reload=True)
+  node.attach_to(scene.root)
+
+  code = 'state = []\ndef gl_render():\n  state.append({})\n  node.state = state\n'
+  node.params['code'] = code.format(1)
+  node.behaviour.gl_render()
+  state = node.state
+  assert_equals(state, [1])
+
+  # Only the function changed, the module scope is kept.
+  node.params['code'] = code.format(2)
+  node.behaviour.gl_render()
+  assert_true(node.state is state)
+  assert_equals(state, [1, 2])
+
+  # A change to the top-level statements executes the whole code again.
+  node.params['code'] = 'x = 0\n' + code.format(3)
+  node.behaviour.gl_render()
+  assert_false(node.state is state)
+  assert_equals(node.state, [3])
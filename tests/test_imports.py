@@ -0,0 +1,45 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+from nose.tools import *
+import subprocess
+import sys
+
+# GUI toolkits that must not be loaded by the core scene graph, so that
+# render workers and batch jobs can start quickly and without a display.
+FORBIDDEN_MODULES = ['wx', 'pygame']
+
+IMPORT_BENCHMARK = '''
+import sys, time
+start = time.perf_counter()
+import vizardry.core.scene
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(','.join(m for m in {!r} if m in sys.modules))
+'''.format(FORBIDDEN_MODULES)
+
+
+def test_headless_import():
+  output = subprocess.check_output([sys.executable, '-c', IMPORT_BENCHMARK])
+  elapsed, loaded = output.decode().splitlines()
+  assert_equals(loaded, '', 'GUI modules imported by vizardry.core.scene')
+  # Generous upper bound, the import usually takes a fraction of this.
+  assert_less(float(elapsed), 5.0)
@@ -0,0 +1,176 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+from nose.tools import *
+import numpy
+from vizardry.core.expressions import Expression, ExpressionError
+from vizardry.core.parameters import AnimationBatch, Parameters, Parameter, Number, Text, \
+  fingerprint as fingerprint_value
+
+
+def test_Parameters():
+  params = Parameters()
+  params.add(Text('a', 'A'))
+  params.add(Text('b', 'B'))
+  params.add(Text('c', 'C'))
+  with assert_raises(ValueError):
+    params.add(Text('a', 'A'))
+
+  assert_equals([p.name for p in params], ['a', 'b', 'c'])
+  assert_true('b' in params)
+  assert_equals(params.param('d'), None)
+  with assert_raises(KeyError):
+    params['d']
+
+  events = []
+  params.bind(Parameters.EV_VALUE_CHANGED, events.append)
+  params.update({'a': 'foo', 'c': 'bar'})
+  assert_equals((params['a'], params['b'], params['c']), ('foo', '', 'bar'))
+  assert_equals(len(events), 1)
+  assert_equals(events[0].data, {'names': ['a', 'c']})
+
+  with assert_raises(KeyError):
+    params.update({'a': 'spam', 'd': 'eggs'})
+  assert_equals(params['a'], 'foo')
+
+  # Only the names of parameters that changed are reported.
+  params.update({'a': 'foo', 'b': 'spam'})
+  assert_equals(events[-1].data, {'names': ['b']})
+  params.update({'a': 'foo', 'b': 'spam'})
+  assert_equals(len(events), 2)
+
+  params('b').emit(Parameter.EV_VALUE_CHANGED, None)
+  assert_equals(events[-1].data, {'names': ['b']})
+
+  params.remove('b')
+  assert_equals(len(params), 2)
+
+
+def test_Parameters_update_invalid():
+  params = Parameters()
+  params.add(Text('text', 'Text'))
+  params.add(Number('number', 'Number'))
+  events = []
+  params.bind(Parameters.EV_VALUE_CHANGED, events.append)
+  with assert_raises(ValueError):
+    params.update({'text': 'foo', 'number': 'not a number'})
+  assert_equals(params['text'], '')
+  assert_equals(events, [])
+
+
+def test_Number_animation():
+  batch = AnimationBatch()
+  params = Parameters(animation=batch)
+  params.add(Number('a', 'A'))
+  params.add(Number('b', 'B', max=5, integer=True))
+  params.add(Number('c', 'C'))
+
+  params['c'] = 3.5
+  params('a').set_keyframe(0, 0)
+  params('a').set_keyframe(10, 10)
+  params('b').set_keyframe(0, 0)
+  params('b').set_keyframe(1, 2)
+  params('b').set_keyframe(2, 10)
+  assert_equals(len(batch), 2)
+
+  for time, a, b in [(-1, 0.0, 0), (0.5, 0.5, 1), (1.5, 1.5, 5), (20, 10.0, 5)]:
+    batch.evaluate(time)
+    assert_equals((params['a'], params['b'], params['c']), (a, b, 3.5))
+    assert_equals(params('a').evaluate(time), a)
+    assert_equals(params('b').evaluate(time), b)
+
+  params('a').clear_keyframes()
+  assert_equals(len(batch), 1)
+  params.remove('b')
+  assert_equals(len(batch), 0)
+
+
+def test_Parameter_expression():
+  params = Parameters()
+  params.add(Number('a', 'A'))
+  params.add(Number('b', 'B', integer=True))
+  params.add(Text('c', 'C'))
+
+  params('b').set_expression('ch("a") * 2 + 0.4')
+  params('c').set_expression('"b={}".format(ch("b"))')
+  assert_equals(params['c'], 'b=0')
+
+  params['a'] = 2
+  assert_equals(params['b'], 4)
+  assert_equals(params['c'], 'b=4')
+
+  # Values are cached until a dependency changes.
+  revision = params('c').revision()
+  assert_equals(params['c'], 'b=4')
+  assert_equals(params('c').revision(), revision)
+
+  params('a').set_expression('ch("c")')
+  with assert_raises(ExpressionError):
+    params['b']
+  with assert_raises(ExpressionError):
+    params('a').set_expression('1 +')
+
+
+def test_Expression_uses_time():
+  assert Expression('time * 2').uses_time
+  assert not Expression('ch("a") * 2').uses_time
+  assert Expression('sum(time * i for i in range(3))').uses_time
+  assert Expression('[time for _ in range(1)][0]').uses_time
+  assert Expression('(lambda x: x * time)(2)').uses_time
+  assert Expression('[frame for _ in range(1)][0]').uses_frame
+  assert not Expression('[x for x in range(3)][0]').uses_frame
+
+
+def test_Parameters_fingerprint():
+  batch = AnimationBatch()
+  params = Parameters(animation=batch)
+  params.add(Text('text', 'Text'))
+  params.add(Number('number', 'Number'))
+  params.add(Number('double', 'Double'))
+  params('double').set_expression('ch("number") * 2')
+
+  fingerprint = params.fingerprint()
+  assert_equals(params.fingerprint(), fingerprint)
+  assert_equals(params('text').fingerprint(), fingerprint_value(''))
+
+  params['text'] = 'x' * 100000
+  assert_not_equal(params.fingerprint(), fingerprint)
+  params['text'] = ''
+  assert_equals(params.fingerprint(), fingerprint)
+
+  # Changes that propagate through expressions and animations.
+  params['number'] = 1
+  assert_equals(params('double').fingerprint(), fingerprint_value(2.0))
+  fingerprint = params.fingerprint()
+  params('number').set_keyframe(0, 0)
+  params('number').set_keyframe(1, 1)
+  batch.evaluate(0.5)
+  assert_equals(params('double').fingerprint(), fingerprint_value(1.0))
+  assert_not_equal(params.fingerprint(), fingerprint)
+
+
+def test_fingerprint_array():
+  array = numpy.zeros(10000, numpy.float32)
+  fingerprint = fingerprint_value(array)
+  assert_equals(fingerprint_value(array.copy()), fingerprint)
+  array[5000] = 1.0  # not visible in the abbreviated repr()
+  assert_not_equal(fingerprint_value(array), fingerprint)
+  assert_not_equal(fingerprint_value(array.astype(numpy.float64)), fingerprint_value(array))
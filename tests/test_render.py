@@ -0,0 +1,54 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+from nose.tools import *
+from vizardry.render import shard_frames, write_png
+
+import numpy
+import os
+import struct
+import tempfile
+import zlib
+
+
+def test_shard_frames():
+  shards = [shard_frames(1, 10, i, 3) for i in range(3)]
+  assert_equals([list(x) for x in shards], [[1, 2, 3, 4], [5, 6, 7], [8, 9, 10]])
+  assert_equals(list(shard_frames(0, 1, 2, 3)), [])
+  with assert_raises(ValueError):
+    shard_frames(0, 10, 3, 3)
+
+
+def test_write_png():
+  pixels = numpy.arange(2 * 3 * 4, dtype=numpy.uint8).reshape(2, 3, 4)
+  with tempfile.TemporaryDirectory() as directory:
+    filename = os.path.join(directory, 'image.png')
+    write_png(filename, pixels)
+    with open(filename, 'rb') as fp:
+      data = fp.read()
+
+  assert_equals(data[:8], b'\x89PNG\r\n\x1a\n')
+  assert_equals(struct.unpack('>II', data[16:24]), (3, 2))
+  length = struct.unpack('>I', data[33:37])[0]
+  assert_equals(data[37:41], b'IDAT')
+  rows = zlib.decompress(data[41:41 + length])
+  assert_equals(rows, b'\0' + pixels[0].tobytes() + b'\0' + pixels[1].tobytes())
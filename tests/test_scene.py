@@ -0,0 +1,100 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+from nose.tools import *
+from vizardry.behaviours.resource import Resource
+from vizardry.core.parameters import Text
+from vizardry.core.scene import Scene, SceneNode
+
+
+def test_SceneNode_emit():
+  scene = Scene()
+  node1 = Resource(scene, 'node1')
+  node2 = Resource(scene, 'node2')
+  node3 = Resource(scene, 'node3')
+  node1.attach_to(scene.root)
+  node2.attach_to(node1)
+  node3.attach_to(scene.root)
+
+  events = []
+  scene.root.bind(SceneNode.EV_NAME_CHANGED, events.append, global_=True)
+  listener = node2.bind(SceneNode.EV_NAME_CHANGED, events.append, global_=True)
+
+  node1.name = 'node4'
+  assert_equals(len(events), 2)
+  assert_true(events[0] is events[1])  # the event is only created once
+
+  # node3 is not in the subtree of node2, but it propagates up to the root.
+  del events[:]
+  node3.name = 'node5'
+  assert_equals(len(events), 1)
+
+  # Moving node2 carries its listener into the new subtree.
+  del events[:]
+  node2.attach_to(node3)
+  node3.name = 'node6'
+  assert_equals(len(events), 2)
+
+  del events[:]
+  node2.unbind(SceneNode.EV_NAME_CHANGED, listener)
+  node3.name = 'node7'
+  assert_equals(len(events), 1)
+
+
+def test_SceneNode_fingerprint():
+  scene = Scene()
+  node = Resource(scene, 'node')
+  node.attach_to(scene.root)
+  fingerprint = node.fingerprint()
+  assert_equals(node.fingerprint(), fingerprint)
+  node.params['text'] = 'foo'
+  assert_not_equal(node.fingerprint(), fingerprint)
+  node.params['text'] = ''
+  assert_equals(node.fingerprint(), fingerprint)
+  node.params.add(Text('other', 'Other'))
+  assert_not_equal(node.fingerprint(), fingerprint)
+
+
+def test_Scene_unbind():
+  scene = Scene()
+  events = []
+  listener = scene.bind(Scene.EV_VIEWPORT_UPDATE, events.append)
+  scene.emit(Scene.EV_VIEWPORT_UPDATE)
+  scene.unbind(Scene.EV_VIEWPORT_UPDATE, listener)
+  scene.emit(Scene.EV_VIEWPORT_UPDATE)
+  assert_equals(len(events), 1)
+  with assert_raises(ValueError):
+    scene.unbind(Scene.EV_VIEWPORT_UPDATE, listener)
+  scene.unbind(Scene.EV_VIEWPORT_UPDATE, listener, missing_ok=True)
+
+
+def test_Scene_node_removed():
+  scene = Scene(queued=True)
+  node1 = Resource(scene, 'node1')
+  node2 = Resource(scene, 'node2')
+  node1.attach_to(scene.root)
+  node2.attach_to(scene.root)
+  removed = []
+  scene.bind(Scene.EV_NODE_REMOVED, lambda ev: removed.append(ev.data['node']))
+  node1.detach()
+  node2.detach()
+  scene.flush_events()
+  assert_equals(removed, [node1, node2])
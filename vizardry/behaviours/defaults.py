@@ -0,0 +1,84 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import textwrap
+
+
+def add_default_nodes(scene):
+  """
+  Adds the nodes of the default scene, a GLInline node that renders the
+  fragment shader in a Resource node.
+  """
+
+  from vizardry.behaviours.glinline import GLInline
+  from vizardry.behaviours.resource import Resource
+
+  glinline = GLInline(scene, hot_reload=True)
+  glinline.params['code'] = textwrap.dedent('''
+    from vizardry import gl
+    from vizardry.gl.api import *
+
+    program = None
+
+    def gl_render():
+      global program
+      if not program:
+        code = node.find_node('../fragment').params['text']
+        program = gl.Program.from_fragment(code)
+      program.use()
+      program.set_float('time', node.scene.time)
+      gl.draw_fullscreen_quad()
+    ''').lstrip()
+  glinline.attach_to(scene.root)
+
+  fragment = Resource(scene, 'fragment')
+  fragment.params['text'] = textwrap.dedent('''
+    #version 330 core
+    uniform float time;
+    in vec2 fragCoord;
+    out vec4 fragColor;
+    const int ncolors = 5;
+    const vec3 colors[ncolors] = vec3[](
+      vec3(0.1, 0.3, 1.0),
+      vec3(0.1, 0.3, 1.0),
+      vec3(0.7, 0.9, 0.8),
+      vec3(1.0, 1.0, 1.0),
+      vec3(0.7, 0.2, 0.2)
+    );
+    void main() {
+      vec2 c = fragCoord.xy;
+      c = c * vec2(4,3) - vec2(2.5, 1.5);
+      vec2 z = vec2(cos(time / 10), sin(time / 10));
+      int limit = 16;
+      int i = 0;
+      for (i = 0; i < limit; ++i) {
+        if (z.x * z.x + z.y * z.y >= 4.0) {
+          break;
+        }
+        z = vec2(z.x*z.x - z.y*z.y, 2.*z.x*z.y) + c;
+      }
+      float x = float(i) / float(limit) * (ncolors-1);
+      int il = int(x) % ncolors;
+      float w = x - il;
+      fragColor = vec4(colors[il] * (1.0-w) + colors[(il+1)] * w, 1.0);
+    }
+    ''').lstrip()
+  fragment.attach_to(scene.root)
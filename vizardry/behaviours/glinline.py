@@ -19,8 +19,12 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
+import ast
+import collections
+import functools
 import nr.interface
 import traceback
+from vizardry import gl
 from vizardry.core.interfaces import GLObjectInterface
 from vizardry.core.parameters import Text
 from vizardry.core.scene import node_factory
@@ -33,14 +37,79 @@ def gl_render():
   pass
 '''.lstrip()
 
+#: The result of #compile_code().
+CompiledCode = collections.namedtuple('CompiledCode', 'code defs_code def_names state')
+
+
+@functools.lru_cache(maxsize=256)
+def compile_code(source, filename):
+  """
+  Compiles the Python *source* code. Returns a #CompiledCode object with
+  the code object for the whole module (*code*), a code object that only
+  executes the top-level function and class definitions (*defs_code*), the
+  names bound by these definitions and a string that represents all other
+  top-level statements (*state*). Two sources with the same *state* only
+  differ in their function and class definitions.
+
+  The result is cached by the source string, thus committing a source that
+  was compiled before (eg. when undoing an edit) is free.
+  """
+
+  tree = ast.parse(source, filename)
+  def_types = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+  defs = [x for x in tree.body if isinstance(x, def_types)]
+  other = [x for x in tree.body if not isinstance(x, def_types)]
+  return CompiledCode(
+    code=compile(tree, filename, 'exec'),
+    defs_code=compile(ast.Module(body=defs, type_ignores=[]), filename, 'exec'),
+    def_names=frozenset(x.name for x in defs),
+    state=ast.dump(ast.Module(body=other, type_ignores=[])))
+
+
+def _invalidate_gl_state():
+  state = gl.current_state(create=False)
+  if state is not None:
+    state.invalidate()
+
 
 class GLInlineBehaviour(nr.interface.Implementation):
+  """
+  Renders by calling the `gl_render()` function defined in the Python code
+  of the node's `code` parameter, or the *gl_render* function that is
+  passed to the constructor.
+
+  Changes to the code are not executed immediately but the next time the
+  node is rendered, thus multiple commits between two frames only cause a
+  single recompile. With *hot_reload* enabled, a change that only touches
+  function or class definitions re-binds these definitions in the existing
+  module scope instead of executing the whole code again, keeping globals
+  such as compiled shader programs alive.
+
+  The code may use the raw OpenGL API. The #gl.StateTracker is invalidated
+  before and after the code runs, thus binds made with the raw functions do
+  not confuse the tracked objects of #vizardry.gl. Bind your own vertex
+  array before setting up vertex attributes, as the one of
+  #gl.draw_fullscreen_quad() stays bound after drawing.
+
+  With *cached* enabled, the node's output is kept in a texture and only
+  rendered again when its parameters (including the code) or inputs change,
+  see #GLObjectInterface.gl_cache_key(). Use it for static layers that do
+  not depend on the scene time.
+  """
+
   nr.interface.implements(GLObjectInterface)
 
-  def __init__(self, gl_render=None):
+  def __init__(self, gl_render=None, hot_reload=False, cached=False):
     super().__init__()
     self.__scope = None
+    self.__compiled = None
+    self.__revision = None
     self.__gl_render = gl_render
+    self.hot_reload = hot_reload
+    self.cached = cached
+
+  def __code_changed(self, ev):
+    self.node.scene.emit(self.node.scene.EV_VIEWPORT_UPDATE)
 
   def __update(self):
     """
@@ -51,34 +120,64 @@ class GLInlineBehaviour(nr.interface.Implementation):
       return
 
     node = self.node
-    self.__scope = {}
+    self.__revision = node.params('code').revision()
+    try:
+      compiled = compile_code(node.params['code'], 'vizardry:' + node.path)
+    except:
+      traceback.print_exc()
+      if self.__scope is None:
+        self.__scope = {}
+      return
 
+    previous = self.__compiled
+    if compiled is previous and self.__scope is not None:
+      return
+
+    reload = (self.hot_reload and self.__scope is not None and
+      previous is not None and previous.state == compiled.state)
     try:
-      code = compile(node.params['code'], 'vizardry:' + node.path, 'exec')
-      scope = {'node': node}
-      exec(code, scope)
+      if reload:
+        scope = self.__scope
+        for name in previous.def_names - compiled.def_names:
+          scope.pop(name, None)
+        exec(compiled.defs_code, scope)
+      else:
+        scope = {'node': node}
+        exec(compiled.code, scope)
     except:
       traceback.print_exc()
+      if self.__scope is None:
+        self.__scope = {}
     else:
       self.__scope = scope
-      node.scene.emit(node.scene.EV_VIEWPORT_UPDATE)
+      self.__compiled = compiled
 
   @nr.interface.override
   def node_attached(self, node):
     if not self.__gl_render:
       node.params.add(Text('code', 'Python Code', multiline=True, syntax='python'))
-      node.params('code').bind(Text.EV_VALUE_CHANGED, lambda ev: self.__update())
+      node.params('code').bind(Text.EV_VALUE_CHANGED, self.__code_changed)
       node.params['code'] = DEFAULT_CODE
 
   @nr.interface.override
   def gl_render(self):
-    if self.__gl_render:
-      self.__gl_render(self.node)
-    else:
-      if self.__scope is None:
-        self.__update()
-      if 'gl_render' in self.__scope:
-        self.__scope['gl_render']()
+    # The user code may change the OpenGL state with the raw API, which the
+    # state tracker does not see.
+    _invalidate_gl_state()
+    try:
+      if self.__gl_render:
+        self.__gl_render(self.node)
+      else:
+        if self.__scope is None or self.__revision != self.node.params('code').revision():
+          self.__update()
+        if 'gl_render' in self.__scope:
+          self.__scope['gl_render']()
+    finally:
+      _invalidate_gl_state()
+
+  @nr.interface.override
+  def gl_cache_key(self):
+    return self.node.fingerprint() if self.cached else None
 
 
 GLInline = node_factory(GLInlineBehaviour, 'glinline')
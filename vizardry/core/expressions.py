@@ -0,0 +1,194 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+Parameter expressions, similar to Houdini's channel expressions. An
+expression is a Python expression that is evaluated in a namespace with the
+following members (in addition to the functions of the #math module):
+
+* `time`, `frame` &ndash; The #Scene.time and #Scene.frame.
+* `ch(path)` &ndash; The value of another parameter. The *path* is either
+  the name of a parameter on the same node or a node path followed by the
+  parameter name, eg. `../other/param`.
+* `out(ref)` &ndash; The value of a node output channel, referenced as
+  `path/to/node:channel`.
+* `node` &ndash; The #SceneNode that the parameter belongs to.
+
+Expressions are compiled once per unique source string. The result is
+cached and the expression is only evaluated again when one of the values
+that it read in the previous evaluation has changed.
+"""
+
+__all__ = ['ExpressionError', 'Expression', 'compile_expression']
+
+import functools
+import math
+import posixpath
+
+
+class ExpressionError(RuntimeError):
+  pass
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_expression(source):
+  """
+  Compiles the expression *source* to a code object. The result is cached
+  by the source string. Raises an #ExpressionError on syntax errors.
+  """
+
+  try:
+    return compile(source, '<expression>', 'eval')
+  except SyntaxError as exc:
+    raise ExpressionError('invalid expression {!r}: {}'.format(source, exc))
+
+
+_GLOBALS = {k: getattr(math, k) for k in dir(math) if not k.startswith('_')}
+
+
+class Expression:
+  """
+  A compiled expression bound to a #Parameter, keeping track of the values
+  that were read during the last evaluation.
+  """
+
+  def __init__(self, source):
+    self.source = source
+    self.code = compile_expression(source)
+    names = _code_names(self.code)
+    self.uses_time = 'time' in names
+    self.uses_frame = 'frame' in names
+    self._deps = None
+    self._evaluating = False
+
+  def __repr__(self):
+    return '<Expression {!r}>'.format(self.source)
+
+  def outdated(self, param):
+    """
+    Returns #True if the expression has never been evaluated or if one of
+    the values that it depends on has changed since the last evaluation.
+    """
+
+    if self._deps is None:
+      return True
+    scene = _get_scene(param)
+    if self.uses_time and self._time != getattr(scene, 'time', None):
+      return True
+    if self.uses_frame and self._frame != getattr(scene, 'frame', None):
+      return True
+    for other, revision in self._deps:
+      if other.revision() != revision:
+        return True
+    for output, value in self._outputs:
+      if output.value is not value:
+        return True
+    return False
+
+  def evaluate(self, param):
+    """
+    Evaluate the expression in the context of the specified *param*.
+    """
+
+    if self._evaluating:
+      raise ExpressionError('cyclic expression {!r} in {!r}'.format(
+        self.source, param))
+
+    node = param.node
+    scene = _get_scene(param)
+    deps = []
+    outputs = []
+
+    def ch(path):
+      other = _find_param(param, path)
+      value = other.eval()
+      deps.append((other, other.revision()))
+      return value
+
+    def out(ref):
+      output = _find_output(param, ref)
+      outputs.append((output, output.value))
+      return output.value
+
+    scope = dict(_GLOBALS, ch=ch, out=out, node=node,
+                 time=getattr(scene, 'time', 0.0),
+                 frame=getattr(scene, 'frame', 0))
+
+    self._evaluating = True
+    try:
+      value = eval(self.code, scope)
+    except ExpressionError:
+      raise
+    except Exception as exc:
+      raise ExpressionError('error in expression {!r} of {!r}: {}'.format(
+        self.source, param, exc)) from exc
+    finally:
+      self._evaluating = False
+
+    self._deps = deps
+    self._outputs = outputs
+    self._time = scope['time']
+    self._frame = scope['frame']
+    return value
+
+
+def _code_names(code):
+  """
+  Returns the global names used by *code*, including the names used in
+  nested code objects such as lambdas, comprehensions and generators.
+  """
+
+  names = set(code.co_names)
+  for const in code.co_consts:
+    if isinstance(const, type(code)):
+      names |= _code_names(const)
+  return names
+
+
+def _get_scene(param):
+  node = param.node
+  return node.scene if node is not None else None
+
+
+def _find_param(param, path):
+  dirname, name = posixpath.split(path)
+  if dirname:
+    node = param.node.find_node(dirname) if param.node else None
+    if node is None:
+      raise ExpressionError('node {!r} not found'.format(dirname))
+    collection = node.params
+  else:
+    collection = param.collection
+  other = collection.param(name) if collection is not None else None
+  if other is None:
+    raise ExpressionError('parameter {!r} not found'.format(path))
+  return other
+
+
+def _find_output(param, ref):
+  path, channel = ref.partition(':')[::2]
+  node = param.node.find_node(path) if param.node else None
+  if node is None:
+    raise ExpressionError('node {!r} not found'.format(path))
+  for output in node.outputs:
+    if output.name == channel:
+      return output
+  raise ExpressionError('output {!r} not found'.format(ref))
@@ -19,10 +19,15 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
+import collections
+import inspect
 import itertools
 import nr.interface
 import traceback
 import sys
+import threading
+import time
+import weakref
 
 
 class Event(nr.interface.Interface):
@@ -36,7 +41,10 @@ class Event(nr.interface.Interface):
 class Listener(nr.interface.Interface):
 
   def invoke(self, event):
-    pass
+    """
+    Handle the *event*. May return #False to indicate that the listener
+    ignored the event, eg. because it did not pass a filter.
+    """
 
 
 class StandardEvent(nr.interface.Implementation):
@@ -53,15 +61,302 @@ class StandardEvent(nr.interface.Implementation):
 
 
 class StandardListener(nr.interface.Implementation):
+  """
+  Calls *func* for every event that passes the optional *filter* function.
+
+  If *weak* is #True, only a weak reference to *func* is kept (a
+  #weakref.WeakMethod for bound methods). Once the function is garbage
+  collected, the listener does nothing and calls its #on_expired callback,
+  which the #EventHandler uses to unbind the listener.
+  """
+
   nr.interface.implements(Listener)
 
-  def __init__(self, func, filter=None):
-    self.func = func
+  def __init__(self, func, filter=None, weak=False):
     self.filter = filter
+    self.weak = weak
+    self.on_expired = None
+    if weak:
+      ref_type = weakref.WeakMethod if inspect.ismethod(func) else weakref.ref
+      self._func = ref_type(func, self.__expired)
+    else:
+      self._func = func
+
+  def __expired(self, ref):
+    if self.on_expired:
+      self.on_expired(self)
+
+  @property
+  def func(self):
+    return self._func() if self.weak else self._func
 
   def invoke(self, event):
-    if not self.filter or self.filter(event):
-      self.func(event)
+    func = self.func
+    if func is None or (self.filter and not self.filter(event)):
+      return False
+    func(event)
+    return True
+
+
+class EventQueue:
+  """
+  Collects events emitted by one or more #EventHandler#s until #flush() is
+  called. Events of the same kind from the same source that are emitted to
+  the same handler are merged, only the most recent event is kept at the
+  position of the first one.
+
+  An inactive queue does not collect events but dispatches them immediately.
+  Events posted from a thread other than the one that created the queue are
+  always collected, as listeners must only be invoked in the owner thread.
+  Background threads can thus safely emit events through an #EventHandler
+  that uses the queue.
+
+  # Parameters
+  active (bool): Whether the queue is initially active.
+  maxsize (int): The maximum number of pending events. Zero means unbounded.
+  overflow (str): The policy that is applied when an event is posted from a
+    thread other than the owner thread while the queue is full. One of
+    #BLOCK (wait until the owner thread flushed the queue), #DROP (discard
+    the new event) or #MERGE (replace the most recent pending event of the
+    same kind, discard the new event if there is none). Events posted from
+    the owner thread are never blocked or discarded.
+  notify (callable): A function that is called without arguments after an
+    event has been posted from a thread other than the owner thread. Can be
+    used to wake up the owner thread's event loop.
+
+  # Members
+  dropped (int): The number of events that have been discarded because of
+    the #overflow policy.
+  """
+
+  BLOCK = 'block'
+  DROP = 'drop'
+  MERGE = 'merge'
+
+  def __init__(self, active=True, maxsize=0, overflow=BLOCK, notify=None):
+    if overflow not in (self.BLOCK, self.DROP, self.MERGE):
+      raise ValueError('invalid overflow policy: {!r}'.format(overflow))
+    self.active = active
+    self.maxsize = maxsize
+    self.overflow = overflow
+    self.notify = notify
+    self.dropped = 0
+    self.owner = threading.get_ident()
+    self._pending = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self._not_full = threading.Condition(self._lock)
+
+  def __len__(self):
+    return len(self._pending)
+
+  def post(self, handler, event, timeout=None):
+    """
+    Queue the *event* for dispatching with the specified *handler*. If the
+    queue is not #active and this method is called from the #owner thread,
+    the event is dispatched immediately.
+
+    # Parameters
+    handler (EventHandler): The handler that dispatches the event.
+    event (Event): The event to dispatch.
+    timeout (float): The maximum number of seconds to wait for space in the
+      queue with the #BLOCK policy. The event is discarded if the queue is
+      still full after the timeout.
+    return (bool): #False if the event was discarded, #True otherwise.
+    """
+
+    in_owner = threading.get_ident() == self.owner
+    if not self.active and in_owner:
+      handler.dispatch(event)
+      return True
+
+    key = (id(handler), event.kind, id(event.source))
+    with self._lock:
+      if not in_owner and not self.__wait_for_space(key, timeout):
+        key = self.__overflow_key(handler, event)
+        if key is None:
+          self.dropped += 1
+          return False
+      self._pending[key] = (handler, event)
+
+    if not in_owner and self.notify is not None:
+      self.notify()
+    return True
+
+  def __wait_for_space(self, key, timeout):
+    def has_space():
+      return (not self.maxsize or len(self._pending) < self.maxsize
+              or key in self._pending)
+    if self.overflow == self.BLOCK:
+      return self._not_full.wait_for(has_space, timeout)
+    return has_space()
+
+  def __overflow_key(self, handler, event):
+    if self.overflow == self.MERGE:
+      for key, (other_handler, other_event) in reversed(self._pending.items()):
+        if other_handler is handler and other_event.kind == event.kind:
+          return key
+    return None
+
+  def flush(self, limit=None):
+    """
+    Dispatch the queued events in the order that they were posted. Events
+    that are emitted while the queue is flushed will be queued for the next
+    call to #flush(). Must be called from the #owner thread.
+
+    # Parameters
+    limit (int): The maximum number of events to dispatch. The remaining
+      events stay in the queue. If #None, all events are dispatched.
+    return (int): The number of events that have been dispatched.
+    """
+
+    with self._lock:
+      if limit is None or limit >= len(self._pending):
+        pending = list(self._pending.values())
+        self._pending.clear()
+      else:
+        pending = [self._pending.popitem(last=False)[1] for _ in range(limit)]
+      self._not_full.notify_all()
+
+    for handler, event in pending:
+      handler.dispatch(event)
+    return len(pending)
+
+
+class EventStats:
+  """
+  Collects statistics about dispatched events and the listeners that were
+  invoked for them. Assign an instance to #EventHandler.stats to enable the
+  instrumentation, either on a single handler or on the #EventHandler class
+  to enable it for all handlers.
+
+  # Members
+  kinds (dict): Maps event kinds to #KindStats.
+  listeners (dict): Maps `(kind, name)` tuples to #ListenerStats, where
+    *name* identifies the listener's function (see #listener_name()).
+    Listeners with the same function name are aggregated.
+  """
+
+  class KindStats:
+    """
+    # Members
+    events (int): The number of events of this kind that were emitted.
+    calls (int): The total number of listener invocations.
+    max_fanout (int): The maximum number of listeners invoked by a single
+      event, including the listeners reached by propagating the event
+      through multiple handlers (eg. in the scene graph).
+    """
+
+    def __init__(self):
+      self.events = 0
+      self.calls = 0
+      self.max_fanout = 0
+
+    def __repr__(self):
+      return '<KindStats events={} calls={} max_fanout={}>'.format(
+        self.events, self.calls, self.max_fanout)
+
+  class ListenerStats:
+    """
+    # Members
+    calls (int): The number of times that the listener was invoked.
+    total_time (float): The cumulative time spent in the listener in seconds.
+    max_time (float): The longest time spent in a single invocation.
+    """
+
+    def __init__(self):
+      self.calls = 0
+      self.total_time = 0.0
+      self.max_time = 0.0
+
+    def __repr__(self):
+      return '<ListenerStats calls={} total_time={:.6f} max_time={:.6f}>'.format(
+        self.calls, self.total_time, self.max_time)
+
+  def __init__(self):
+    self.kinds = {}
+    self.listeners = {}
+    self._last_event = None
+    self._last_fanout = 0
+
+  @staticmethod
+  def listener_name(listener):
+    """
+    Returns a string that identifies the function called by a *listener*.
+    """
+
+    func = getattr(listener, 'func', listener)
+    if func is None:
+      return '<expired>'
+    module = getattr(func, '__module__', None)
+    name = getattr(func, '__qualname__', None) or repr(func)
+    return '{}.{}'.format(module, name) if module else name
+
+  def record_event(self, event, num_listeners):
+    """
+    Called by the #EventHandler after it dispatched an *event* to
+    *num_listeners* listeners. Listeners that ignored the event are not
+    counted.
+    """
+
+    stats = self.kinds.get(event.kind)
+    if stats is None:
+      stats = self.kinds[event.kind] = self.KindStats()
+    if event is not self._last_event:
+      stats.events += 1
+      self._last_event = event
+      self._last_fanout = 0
+    self._last_fanout += num_listeners
+    stats.calls += num_listeners
+    stats.max_fanout = max(stats.max_fanout, self._last_fanout)
+
+  def record_listener(self, event, listener, elapsed):
+    """
+    Called by the #EventHandler after a *listener* was invoked for the
+    *event*, taking *elapsed* seconds.
+    """
+
+    key = (event.kind, self.listener_name(listener))
+    stats = self.listeners.get(key)
+    if stats is None:
+      stats = self.listeners[key] = self.ListenerStats()
+    stats.calls += 1
+    stats.total_time += elapsed
+    stats.max_time = max(stats.max_time, elapsed)
+
+  def top_listeners(self, n=10, key='total_time'):
+    """
+    Returns a list of the *n* `((kind, name), ListenerStats)` pairs with the
+    highest value for the #ListenerStats attribute *key*.
+    """
+
+    items = sorted(self.listeners.items(), key=lambda x: getattr(x[1], key),
+                   reverse=True)
+    return items[:n]
+
+  def reset(self):
+    self.kinds.clear()
+    self.listeners.clear()
+    self._last_event = None
+    self._last_fanout = 0
+
+  def format(self, n=10):
+    """
+    Returns a human readable summary of the event counters and the *n*
+    most expensive listeners.
+    """
+
+    lines = ['{:<40} {:>8} {:>8} {:>8}'.format('kind', 'events', 'calls', 'fanout')]
+    for kind, stats in sorted(self.kinds.items(), key=lambda x: -x[1].events):
+      lines.append('{:<40} {:>8} {:>8} {:>8}'.format(
+        str(kind), stats.events, stats.calls, stats.max_fanout))
+    lines.append('')
+    lines.append('{:<60} {:>8} {:>10} {:>10}'.format(
+      'listener', 'calls', 'total ms', 'max ms'))
+    for (kind, name), stats in self.top_listeners(n):
+      lines.append('{:<60} {:>8} {:>10.3f} {:>10.3f}'.format(
+        '{} ({})'.format(name, kind), stats.calls, stats.total_time * 1000,
+        stats.max_time * 1000))
+    return '\n'.join(lines)
 
 
 class EventHandler:
@@ -77,12 +372,26 @@ class EventHandler:
   listener_class (Listener): An implementation of the #Listener interface.
     Defaults to the #StandardListener class which just the function to call
     on the event and an optional *filter* function.
+  queue (EventQueue): If specified, events passed to #emit() are posted to
+    this queue instead of being dispatched immediately.
+
+  Without a #queue, #emit() invokes the listeners in the calling thread and
+  must not be used from threads other than the one that binds listeners.
+
+  # Members
+  stats (EventStats): If not #None, every dispatched event and listener
+    invocation is recorded in this object. Defaults to the value of the
+    class attribute, which is #None.
   """
 
-  def __init__(self, event_class=StandardEvent, listener_class=StandardListener):
+  stats = None
+
+  def __init__(self, event_class=StandardEvent, listener_class=StandardListener,
+               queue=None):
     self.event_class = event_class
     self.listener_class = listener_class
     self.listeners = {}
+    self.queue = queue
 
   def bind(self, __kind, *args, **kwargs):
     """
@@ -94,24 +403,42 @@ class EventHandler:
     __kind (any): The event kind to bind the listener to. If this is #None,
       the listener will bind to any event.
     *args, **kwargs: Arguments to the #listener_class.
-    return (listener_class): The listener added to the event handler.
+    return (listener_class): The listener added to the event handler. It
+      serves as the handle to #unbind() the listener.
     """
 
     listener = self.listener_class(*args, **kwargs)
-    self.listeners.setdefault(__kind, []).append(listener)
+    # The listeners for every kind are stored as keys of an (ordered) dict
+    # to allow unbinding them in constant time.
+    self.listeners.setdefault(__kind, {})[listener] = None
+    if hasattr(listener, 'on_expired'):
+      listener.on_expired = lambda l: self.unbind(__kind, l, missing_ok=True)
     return listener
 
-  def unbind(self, kind, listener):
+  def unbind(self, kind, listener, missing_ok=False):
     """
     Unbind a listener from the specified event kind.
 
     # Parameter
     kind (any): The event kind.
     listener (listener_class): The listener returned from #bind().
+    missing_ok (bool): Do not raise if *listener* is not bound.
     raise (ValueError): If *listener* is not a listener for the event.
     """
 
-    self.listeners.get(kind, []).remove(listener)
+    try:
+      del self.listeners[kind][listener]
+    except KeyError:
+      if not missing_ok:
+        raise ValueError('listener is not bound to {!r}'.format(kind))
+
+  def has_listeners(self, kind):
+    """
+    Returns #True if there is at least one listener that would be invoked
+    for an event of the specified *kind*.
+    """
+
+    return bool(self.listeners.get(None) or self.listeners.get(kind))
 
   def emit(self, *args, **kwargs):
     """
@@ -119,19 +446,57 @@ class EventHandler:
     exceptions that occur inside the listeners will be caught and
     forwarded to the #handle_exception() method.
 
+    If the handler has a #queue, the event is posted to the queue instead
+    and the listeners will be invoked when the queue is flushed.
+
     # Parameters
     *args, **kwargs: Arguments for the #event_class constructor.
     """
 
     event = self.event_class(*args, **kwargs)
-    listeners = itertools.chain(
-      self.listeners.get(None, []), self.listeners.get(event.kind, []))
+    if self.queue is not None:
+      self.queue.post(self, event)
+    else:
+      self.dispatch(event)
+
+  def dispatch(self, event):
+    """
+    Invoke all listeners that are bound to the kind of the specified *event*.
+    Unlike #emit(), this method accepts an already constructed event object
+    which allows the same event to be dispatched by multiple handlers.
+
+    # Parameters
+    event (Event): The event to pass to the listeners.
+    """
+
+    stats = self.stats
+    if not self.listeners and stats is None:
+      return
+
+    # Copy the listeners so they can unbind themselves while being invoked.
+    listeners = tuple(itertools.chain(
+      self.listeners.get(None, ()), self.listeners.get(event.kind, ())))
+
+    if stats is None:
+      for listener in listeners:
+        try:
+          listener.invoke(event)
+        except:
+          self.handle_exception(event, listener, sys.exc_info())
+      return
 
+    num_invoked = 0
     for listener in listeners:
+      start = time.perf_counter()
       try:
-        listener.invoke(event)
+        invoked = listener.invoke(event) is not False
       except:
+        invoked = True
         self.handle_exception(event, listener, sys.exc_info())
+      if invoked:
+        stats.record_listener(event, listener, time.perf_counter() - start)
+        num_invoked += 1
+    stats.record_event(event, num_invoked)
 
   def handle_exception(self, event, listener, exc_info):
     """
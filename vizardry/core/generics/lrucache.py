@@ -0,0 +1,106 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+import collections
+
+
+class LRUCache:
+  """
+  A mapping that keeps at most *maxsize* items. Getting or putting an item
+  makes it the most recently used one. When there are more than *maxsize*
+  items, the least recently used ones are removed and passed to *on_evict*,
+  eg. to destroy the resources that they hold.
+
+  # Parameters
+  maxsize (int): The maximum number of items.
+  on_evict (callable): A function that is called with the value of every
+    item that is evicted, see #evict().
+  """
+
+  def __init__(self, maxsize, on_evict=None):
+    self.maxsize = maxsize
+    self.on_evict = on_evict
+    self._items = collections.OrderedDict()
+
+  def __len__(self):
+    return len(self._items)
+
+  def __contains__(self, key):
+    return key in self._items
+
+  def __iter__(self):
+    """
+    Iterates over the keys, from the least to the most recently used.
+    """
+
+    return iter(self._items)
+
+  def get(self, key, default=None):
+    """
+    Returns the value for *key* and marks it as the most recently used, or
+    returns *default* if there is no such item.
+    """
+
+    try:
+      self._items.move_to_end(key)
+    except KeyError:
+      return default
+    return self._items[key]
+
+  def put(self, key, value):
+    """
+    Sets the value for *key* and marks it as the most recently used. Evicts
+    the least recently used items if the cache is full.
+    """
+
+    self._items[key] = value
+    self._items.move_to_end(key)
+    while len(self._items) > self.maxsize:
+      self.evict(next(iter(self._items)))
+
+  def pop(self, key, default=None):
+    """
+    Removes the item for *key* without evicting it, and returns its value
+    or *default*.
+    """
+
+    return self._items.pop(key, default)
+
+  def evict(self, key):
+    """
+    Removes the item for *key* and passes its value to #on_evict. Returns
+    #False if there is no such item.
+    """
+
+    if key not in self._items:
+      return False
+    value = self._items.pop(key)
+    if self.on_evict is not None:
+      self.on_evict(value)
+    return True
+
+  def clear(self):
+    """
+    Evicts all items.
+    """
+
+    for key in list(self._items):
+      self.evict(key)
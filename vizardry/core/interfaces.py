@@ -24,12 +24,11 @@ This module covers the core interfaces understood by Vizardry.
 """
 
 import nr.interface
-import pkg_resources
+import os
 import weakref
-import wx
 from vizardry.gl import ResourceManager as GLResourceManager
 
-ICON = None
+ICON = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'res', 'python_file.png')
 
 
 class NodeBehaviour(nr.interface.Interface):
@@ -56,9 +55,11 @@ class NodeBehaviour(nr.interface.Interface):
 
   @nr.interface.default
   def node_icon(self):
-    global ICON
-    if ICON is None:
-      ICON = wx.Image(pkg_resources.resource_stream('vizardry', 'res/python_file.png'))
+    """
+    Return the icon of the node. This is either the filename of an image or
+    an image object supported by the user interface (eg. a #wx.Image).
+    """
+
     return ICON
 
   @nr.interface.default
@@ -89,10 +90,29 @@ class GLObjectInterface(NodeBehaviour):
     of this method is responsible for entering the #gl_resources context
     manager in order to assign GL objects allocated in this method to the
     correct resource manager.
+
+    Instead of drawing immediately, the node may submit draw items to the
+    #vizardry.gl.RenderQueue. They are drawn after all nodes have been
+    rendered, sorted to minimize state changes and merged into instanced
+    draws where possible.
     """
 
     pass
 
+  @nr.interface.default
+  def gl_cache_key(self):
+    """
+    Return a key to have the output of #gl_render() cached in a texture.
+    #gl_render() is then only called when the key changes, and the cached
+    image is composited into the canvas in the other frames. Return #None
+    (the default) to render the node every frame.
+
+    Nodes whose output only depends on their parameters and inputs can
+    return #SceneNode.fingerprint().
+    """
+
+    return None
+
   @nr.interface.default
   def gl_cleanup(self):
     """
@@ -23,43 +23,120 @@
 This module provides the API for node parameters.
 """
 
-import wx
+import bisect
+import collections
+import hashlib
+import numpy
+import weakref
+from vizardry.core.expressions import Expression
 from vizardry.core.generics.eventhandler import EventHandler
 
 
+def fingerprint(value):
+  """
+  Returns a 64-bit hash of a parameter *value* that, unlike #hash(), is the
+  same in every process. NumPy arrays are hashed by their contents. Values
+  other than strings, bytes, arrays and numbers are hashed by their
+  #repr().
+  """
+
+  if isinstance(value, bytes):
+    data = b'b' + value
+  elif isinstance(value, str):
+    data = b's' + value.encode('utf8')
+  elif isinstance(value, numpy.ndarray):
+    # The repr() of large arrays is abbreviated.
+    header = 'a{}{}:'.format(value.dtype.str, value.shape).encode('utf8')
+    data = header + numpy.ascontiguousarray(value).tobytes()
+  else:
+    data = type(value).__name__.encode('utf8') + b':' + repr(value).encode('utf8')
+  return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
 class Parameters:
   """
-  Manages a collection of parameters.
+  Manages a collection of parameters. The parameters are indexed by their
+  name, thus the name of a #Parameter must not be changed after it has been
+  added to the collection.
+
+  The collection emits a #EV_VALUE_CHANGED event when the value of one or
+  more of its parameters changed, either with #update() or when a parameter
+  emitted its own #Parameter.EV_VALUE_CHANGED event. The event data is a
+  dictionary with a `names` key that lists the names of the changed
+  parameters.
+
+  # Parameters
+  event_queue (EventQueue): If specified, the queue is assigned to every
+    #Parameter that is added to the collection.
+  animation (AnimationBatch): If specified, the batch is assigned to every
+    #Number parameter that is added to the collection.
+  node (SceneNode): The node that owns the collection. Used to resolve
+    node paths in parameter expressions.
   """
 
-  def __init__(self):
-    self._params = []
+  EV_VALUE_CHANGED = 'Parameter.EV_VALUE_CHANGED'
+
+  def __init__(self, event_queue=None, animation=None, node=None):
+    self._params = collections.OrderedDict()
+    self._forwarders = {}
+    self._revision = 0
+    self._volatile = ()
+    self._volatile_revision = None
+    self._fingerprint = None
+    self._fingerprint_key = None
+    self._node = weakref.ref(node) if node is not None else None
+    self.event_queue = event_queue
+    self.animation = animation
+    self.__listeners = EventHandler(queue=event_queue)
 
   def __getitem__(self, name):
     """
-    Return the value of a parameter with the specified *name*.
+    Return the value of a parameter with the specified *name*. If the
+    parameter has an expression, this is the result of the expression.
     """
 
-    param = self.param(name)
-    if param is None:
-      raise KeyError(name)
-    return param.get_value()
+    return self(name).eval()
 
   def __setitem__(self, name, value):
     """
     Set the value of a parmaeter with the specified *name*.
     """
 
-    param = self.param(name)
-    if param is None:
-      raise KeyError(name)
-    param.set_value(value)
+    self(name).set_value(value)
 
   def __call__(self, name):
-    param = self.param(name)
-    if param is None:
-      raise KeyError(name)
-    return param
+    try:
+      return self._params[name]
+    except KeyError:
+      raise KeyError(name) from None
+
+  def __contains__(self, name):
+    return name in self._params
+
+  def __iter__(self):
+    return iter(self._params.values())
+
+  def __len__(self):
+    return len(self._params)
+
+  @property
+  def node(self):
+    return self._node() if self._node is not None else None
+
+  def bind(self, kind, func, weak=False):
+    """
+    Bind a listener to events emitted by the collection. Returns the
+    listener that can be passed to #unbind().
+    """
+
+    return self.__listeners.bind(kind, func, weak=weak)
+
+  def unbind(self, kind, listener):
+    """
+    Unbind a listener that was returned by #bind().
+    """
+
+    self.__listeners.unbind(kind, listener)
 
   def param(self, name):
     """
@@ -67,10 +144,29 @@ class Parameters:
     is no such parameter in the collection.
     """
 
-    for param in self._params:
-      if param.name == name:
-        return param
-    return None
+    return self._params.get(name)
+
+  def update(self, values):
+    """
+    Set the values of multiple parameters from the *values* mapping (or
+    iterable of key/value pairs). Emits a single #EV_VALUE_CHANGED event
+    with the names of the parameters whose value actually changed, or no
+    event if none did. All values are validated first, thus if one of the
+    names is not in the collection (#KeyError) or one of the values can not
+    be converted to its parameter's type, no value is changed.
+    """
+
+    values = collections.OrderedDict(values)
+    params = [(name, self(name)) for name in values]
+    converted = [(name, param, param._convert(values[name])) for name, param in params]
+    changed = []
+    for name, param, value in converted:
+      revision = param._revision
+      param.set_value(value)
+      if param._revision != revision:
+        changed.append(name)
+    if changed:
+      self.__listeners.emit(self.EV_VALUE_CHANGED, {'names': changed}, self)
 
   def remove(self, name):
     """
@@ -78,10 +174,14 @@ class Parameters:
     there is no such parameter in the collection.
     """
 
-    param = self.param(name)
+    param = self._params.pop(name, None)
     if param is None:
       raise ValueError('unknown parameter', name)
-    self._params.remove(param)
+    param.unbind(Parameter.EV_VALUE_CHANGED, self._forwarders.pop(name))
+    param.collection = None
+    self._revision += 1
+    if isinstance(param, Number):
+      param.animation = None
 
   def add(self, param):
     """
@@ -89,32 +189,66 @@ class Parameters:
     the parameter is already occupied.
     """
 
-    for other in self._params:
-      if other.name == param.name:
-        raise ValueError('parameter name already occupied: {!r}'.format(name))
-    self._params.append(param)
+    if param.name in self._params:
+      raise ValueError('parameter name already occupied: {!r}'.format(param.name))
+    if self.event_queue is not None:
+      param.event_queue = self.event_queue
+    if self.animation is not None and isinstance(param, Number):
+      param.animation = self.animation
+    param.collection = self
+    self._forwarders[param.name] = param.bind(Parameter.EV_VALUE_CHANGED, self.__forward)
+    self._params[param.name] = param
+    self._revision += 1
+
+  def fingerprint(self):
+    """
+    Returns a stable 64-bit hash of the names and values of all parameters
+    in the collection. The fingerprint is cached and only recomputed if a
+    parameter was added, removed or changed since the last call, so
+    checking it for changes is cheap. Only parameters with an expression or
+    keyframes are polled on every call.
+    """
+
+    if self._volatile_revision != self._revision:
+      self._volatile = [p for p in self._params.values() if p.volatile]
+      self._volatile_revision = self._revision
+    volatile = tuple(p.revision() for p in self._volatile)
+    key = (self._revision, volatile)
+    if key != self._fingerprint_key:
+      hasher = hashlib.blake2b(digest_size=8)
+      for name, param in self._params.items():
+        hasher.update(name.encode('utf8'))
+        hasher.update(param.fingerprint().to_bytes(8, 'little'))
+      self._fingerprint = int.from_bytes(hasher.digest(), 'little')
+      self._fingerprint_key = key
+    return self._fingerprint
+
+  def __forward(self, ev):
+    self.__listeners.emit(self.EV_VALUE_CHANGED, {'names': [ev.source.name]}, self)
 
   def create_panel(self, parent):
     """
     Creates a #wx.Panel filled with all controls of the parameters declared
-    in the collection.
+    in the collection. This imports the wx adapter from
+    #vizardry.main.parameters.
     """
 
-    panel = wx.Panel(parent)
-    sizer = wx.BoxSizer(wx.VERTICAL)
-    for param in self._params:
-      label = wx.StaticText(panel, label=param.label)
-      control = param.create_control(panel)
-      sizer.Add(label, 0)
-      sizer.Add(control, 1, wx.EXPAND)
-    panel.SetSizer(sizer)
-    panel.SetAutoLayout(True)
-    return panel
+    from vizardry.main.parameters import create_panel
+    return create_panel(self, parent)
 
 
 class Parameter:
   """
   Base class for parameters.
+
+  Instead of a static value, a parameter can be driven by an expression
+  (see #vizardry.core.expressions). Use #eval() to get the effective value
+  of the parameter, #get_value() always returns the static value.
+
+  Subclasses must call #_changed() when the static value changes.
+
+  This module does not depend on a GUI toolkit. The widgets for the
+  parameters are implemented in #vizardry.main.parameters.
   """
 
   EV_VALUE_CHANGED = 'Parameter.EV_VALUE_CHANGED'
@@ -123,17 +257,149 @@ class Parameter:
     self.name = name
     self.label = label
     self.__listeners = EventHandler()
+    self.__collection = None
+    self._expression = None
+    self._expression_value = None
+    self._revision = 0
+    self._control = None
+    self._fingerprint = None
+    self._fingerprint_revision = None
 
   def __repr__(self):
     return '<{} name={!r} label={!r}>'.format(
       type(self).__name__, self.name, self.label)
 
-  def bind(self, kind, func):
+  @property
+  def collection(self):
+    """
+    The #Parameters collection that the parameter was added to.
+    """
+
+    return self.__collection() if self.__collection is not None else None
+
+  @collection.setter
+  def collection(self, collection):
+    self.__collection = weakref.ref(collection) if collection is not None else None
+
+  @property
+  def node(self):
+    """
+    The #SceneNode that the parameter belongs to, or #None.
+    """
+
+    collection = self.collection
+    return collection.node if collection is not None else None
+
+  @property
+  def expression(self):
+    """
+    The source of the parameter's expression, or #None.
+    """
+
+    return self._expression.source if self._expression is not None else None
+
+  def set_expression(self, source):
+    """
+    Drive the parameter by the expression *source*. Pass #None to remove
+    the expression. Raises an #ExpressionError if the expression is invalid.
+    """
+
+    self._expression = Expression(source) if source is not None else None
+    self._expression_value = None
+    self._changed()
+
+  def eval(self):
+    """
+    Returns the value of the parameter's expression or the value returned
+    by #get_value() if the parameter has no expression. The expression is
+    only evaluated if a value that it depends on has changed.
+    """
+
+    expression = self._expression
+    if expression is None:
+      return self.get_value()
+    if expression.outdated(self):
+      value = self._convert(expression.evaluate(self))
+      if value != self._expression_value:
+        self._expression_value = value
+        self._changed()
+    return self._expression_value
+
+  def revision(self):
+    """
+    Returns a token that changes whenever the result of #eval() may have
+    changed. Used to track the dependencies of expressions.
+    """
+
+    if self._expression is not None:
+      self.eval()
+    return self._revision
+
+  @property
+  def volatile(self):
+    """
+    #True if the value of the parameter can change without a call to
+    #_changed(), eg. because it is driven by an expression.
+    """
+
+    return self._expression is not None
+
+  def fingerprint(self):
+    """
+    Returns a stable 64-bit hash of the value returned by #eval(). The hash
+    is only recomputed when the parameter changed, which makes it a cheap
+    cache key even for large values.
+    """
+
+    revision = self.revision()
+    if revision != self._fingerprint_revision:
+      self._fingerprint = fingerprint(self.eval())
+      self._fingerprint_revision = revision
+    return self._fingerprint
+
+  def _changed(self):
+    self._revision += 1
+    collection = self.collection
+    if collection is not None:
+      collection._revision += 1
+    if self._control is not None:
+      self._control.sync()
+
+  def _convert(self, value):
+    """
+    Convert the result of an expression to the parameter's value type.
+    """
+
+    return value
+
+  @property
+  def event_queue(self):
+    """
+    The #EventQueue that events emitted by this parameter are posted to, or
+    #None if events are dispatched immediately.
+    """
+
+    return self.__listeners.queue
+
+  @event_queue.setter
+  def event_queue(self, queue):
+    self.__listeners.queue = queue
+
+  def bind(self, kind, func, weak=False):
     """
-    Bind a listener to events that can be emitted by this parameter.
+    Bind a listener to events that can be emitted by this parameter. If
+    *weak* is #True, the listener is unbound automatically when *func* is
+    garbage collected. Returns the listener that can be passed to #unbind().
     """
 
-    self.__listeners.bind(kind, func)
+    return self.__listeners.bind(kind, func, weak=weak)
+
+  def unbind(self, kind, listener):
+    """
+    Unbind a listener that was returned by #bind().
+    """
+
+    self.__listeners.unbind(kind, listener)
 
   def emit(self, kind, data):
     """
@@ -142,11 +408,20 @@ class Parameter:
 
     self.__listeners.emit(kind, data, self)
 
+  def commit(self, value):
+    """
+    Set the value of the parameter and emit #EV_VALUE_CHANGED. This is
+    called by the parameter's control when the user changed the value.
+    """
+
+    self.set_value(value)
+    self.emit(self.EV_VALUE_CHANGED, None)
+
   def create_control(self, parent):
     """
-    Return a #wx.Window that controls the parameter value. Implementors
-    usually keep a reference to the created control in order to be able
-    to get/set the value from the widget.
+    Return a #wx.Window that controls the parameter value. This is only
+    called by #vizardry.main.parameters.create_control() for parameter types
+    that have no control registered with #control_factory().
     """
 
     raise NotImplementedError
@@ -174,9 +449,23 @@ class Number(Parameter):
   """
   Represents numeric parameter (integral or decimal) with support for
   min/max values, a slider and units.
-  """
 
-  # TODO
+  The parameter can be animated by adding keyframes with #set_keyframe().
+  The value is then linearly interpolated between the keyframes and held
+  constant before the first and after the last keyframe. Animated numbers
+  that are part of a scene are evaluated all at once by the scene's
+  #AnimationBatch, #get_value() then returns the value at the time of the
+  last evaluation. Outside of a batch, #get_value() returns the value at
+  time zero, use #evaluate() to sample the curve at any other time.
+
+  # Parameters
+  min, max (number): The range of the value. #None for no limit.
+  minslider, maxslider (number): The range of the slider. Defaults to the
+    *min* and *max* values. The slider is only shown if the range is finite.
+  slider (bool): Whether to show a slider.
+  degree (bool): Whether the value is an angle in degree.
+  integer (bool): Whether the value is rounded to an integer.
+  """
 
   def __init__(self, name, label, min=None, max=None, minslider=None,
                maxslider=None, slider=True, degree=False, integer=False):
@@ -188,15 +477,230 @@ class Number(Parameter):
     self.slider = slider
     self.degree = degree
     self.integer = integer
+    self._value = self._convert(0)
+    self._keys = []
+    self._animation = None
+    self._batch_index = None
+
+  def _convert(self, value):
+    if self.min is not None and value < self.min:
+      value = self.min
+    if self.max is not None and value > self.max:
+      value = self.max
+    return int(round(value)) if self.integer else float(value)
+
+  @property
+  def animation(self):
+    """
+    The #AnimationBatch that evaluates the keyframes of this parameter.
+    This is assigned by the #Parameters collection.
+    """
 
-  def create_control(self, parent):
-    raise NotImplementedError
+    return self._animation
+
+  @animation.setter
+  def animation(self, batch):
+    if self._animation is not None:
+      self._animation.discard(self)
+    self._animation = batch
+    if batch is not None and self._keys:
+      batch.add(self)
+
+  @property
+  def animated(self):
+    return bool(self._keys)
+
+  @property
+  def keyframes(self):
+    """
+    A list of the `(time, value)` keyframes sorted by time.
+    """
+
+    return list(self._keys)
+
+  def set_keyframe(self, time, value):
+    """
+    Add a keyframe or replace the keyframe at the specified *time*.
+    """
+
+    key = (float(time), float(value))
+    index = bisect.bisect_left(self._keys, (key[0],))
+    if index < len(self._keys) and self._keys[index][0] == key[0]:
+      self._keys[index] = key
+    else:
+      self._keys.insert(index, key)
+    self.__keys_changed()
+
+  def remove_keyframe(self, time):
+    """
+    Remove the keyframe at the specified *time*. Raises a #ValueError if
+    there is no keyframe at that time.
+    """
+
+    time = float(time)
+    index = bisect.bisect_left(self._keys, (time,))
+    if index == len(self._keys) or self._keys[index][0] != time:
+      raise ValueError('no keyframe at time {!r}'.format(time))
+    del self._keys[index]
+    self.__keys_changed()
+
+  def clear_keyframes(self):
+    self._keys.clear()
+    self.__keys_changed()
+
+  def __keys_changed(self):
+    self._changed()
+    batch = self._animation
+    if batch is not None:
+      if self._keys:
+        batch.add(self)
+      else:
+        batch.discard(self)
+      batch.invalidate()
+
+  def evaluate(self, time):
+    """
+    Returns the value of the parameter at the specified *time*.
+    """
+
+    if not self._keys:
+      return self._value
+    times, values = zip(*self._keys)
+    return self._convert(numpy.interp(time, times, values))
+
+  @property
+  def slider_range(self):
+    """
+    The `(min, max)` range of the slider, items may be #None.
+    """
+
+    lo = self.min if self.minslider is None else self.minslider
+    hi = self.max if self.maxslider is None else self.maxslider
+    return lo, hi
+
+  # Parameter
 
   def get_value(self):
-    raise NotImplementedError
+    batch = self._animation
+    if not self._keys:
+      return self._value
+    if batch is None:
+      return self.evaluate(0.0)
+    values = batch.evaluate(batch.time)
+    return self._convert(values[self._batch_index])
 
   def set_value(self, value):
-    raise NotImplementedError
+    """
+    Set the static value of the parameter, which is used when the parameter
+    has no keyframes.
+    """
+
+    value = self._convert(value)
+    if value != self._value:
+      self._value = value
+      self._changed()
+
+  @property
+  def volatile(self):
+    return super().volatile or (bool(self._keys) and self._animation is not None)
+
+  def revision(self):
+    revision = super().revision()
+    if self._keys and self._animation is not None:
+      return (revision, self._animation.time)
+    return revision
+
+
+class AnimationBatch:
+  """
+  Evaluates the keyframes of many #Number parameters in a single NumPy pass.
+  The keyframes of all parameters are packed into padded arrays that are
+  rebuilt only when a parameter's keyframes change. #Number.get_value()
+  reads its value from the array produced by the last #evaluate() call.
+
+  # Members
+  time (float): The time of the last evaluation.
+  values (numpy.ndarray): The values of the last evaluation.
+  """
+
+  def __init__(self):
+    self._params = weakref.WeakSet()
+    self._dirty = True
+    self.time = 0.0
+    self.values = numpy.empty(0)
+
+  def __len__(self):
+    return len(self._params)
+
+  def add(self, param):
+    if param not in self._params:
+      self._params.add(param)
+      self._dirty = True
+
+  def discard(self, param):
+    if param in self._params:
+      self._params.discard(param)
+      self._dirty = True
+
+  def invalidate(self):
+    """
+    Mark the packed keyframes as out of date, causing them to be rebuilt on
+    the next #evaluate().
+    """
+
+    self._dirty = True
+
+  def __pack(self):
+    params = list(self._params)
+    num_params = len(params)
+    num_keys = max((len(p._keys) for p in params), default=0)
+    inf = float('inf')
+
+    # Unused keyframe slots have an infinite time and repeat the last value.
+    self._times = numpy.full((num_params, num_keys), inf)
+    self._values = numpy.zeros((num_params, num_keys))
+    self._counts = numpy.empty(num_params, dtype=int)
+    self._min = numpy.empty(num_params)
+    self._max = numpy.empty(num_params)
+    self._integer = numpy.empty(num_params, dtype=bool)
+    for index, param in enumerate(params):
+      times, values = zip(*param._keys)
+      count = len(times)
+      self._times[index, :count] = times
+      self._values[index, :count] = values
+      self._values[index, count:] = values[-1]
+      self._counts[index] = count
+      self._min[index] = -inf if param.min is None else param.min
+      self._max[index] = inf if param.max is None else param.max
+      self._integer[index] = param.integer
+      param._batch_index = index
+
+    self._rows = numpy.arange(num_params)
+    self._dirty = False
+
+  def evaluate(self, time):
+    """
+    Evaluate all parameters at the specified *time* and return the array of
+    values. The result is cached until the time or the keyframes change.
+    """
+
+    if not self._dirty and time == self.time:
+      return self.values
+    if self._dirty:
+      self.__pack()
+
+    rows = self._rows
+    index = (self._times <= time).sum(axis=1)
+    i0 = numpy.maximum(index - 1, 0)
+    i1 = numpy.minimum(index, self._counts - 1)
+    t0, t1 = self._times[rows, i0], self._times[rows, i1]
+    v0, v1 = self._values[rows, i0], self._values[rows, i1]
+    span = t1 - t0
+    weight = numpy.where(span > 0, (time - t0) / numpy.where(span > 0, span, 1.0), 0.0)
+    values = numpy.clip(v0 + (v1 - v0) * weight, self._min, self._max)
+    self.values = numpy.where(self._integer, numpy.round(values), values)
+    self.time = time
+    return self.values
 
 
 class Text(Parameter):
@@ -205,64 +709,22 @@ class Text(Parameter):
   will be created.
   """
 
-  # TODO: Syntax highlighting with Pygments
-
   def __init__(self, name, label, multiline=False, syntax=None):
     super().__init__(name, label)
     self.multiline = multiline
     self.syntax = syntax
-    self._widget = None
     self._value = ''
 
-  def __on_key(self, ev):
-    if ev.GetKeyCode() == wx.WXK_RETURN:
-      if not self.multiline or wx.GetKeyState(wx.WXK_CONTROL):
-        self.__commit()
-        return
-    ev.Skip()
-
-  def __on_kill_focus(self, ev):
-    ev.Skip()
-    new_value = self._widget.GetValue()
-    if new_value != self._value:
-      self._value = new_value
-      self.emit(self.EV_VALUE_CHANGED, None)
-
-  def __commit(self):
-    self.emit(self.EV_VALUE_CHANGED, None)
-
   # Parameter
 
-  def create_control(self, parent):
-    self._value = self.get_value()
-
-    style = 0
-    if self.multiline:
-      style |= wx.TE_MULTILINE|wx.TE_DONTWRAP
-    if self.syntax:
-      style |= wx.TE_RICH2
-
-    self._widget = wx.TextCtrl(parent, style=style)
-
-    if self.syntax:
-      # TODO: Somehow to syntax highlighting (pygments and RTF?)
-      self._widget.SetFont(
-        wx.Font(10, wx.FONTFAMILY_TELETYPE, wx.FONTSTYLE_NORMAL,
-          wx.FONTWEIGHT_NORMAL, False, 'DejaVu Sans Mono'))
-
-    self._widget.SetValue(self._value)
-
-    self._widget.Bind(wx.EVT_KILL_FOCUS, self.__on_kill_focus)
-    self._widget.Bind(wx.EVT_CHAR_HOOK, self.__on_key)
-    return self._widget
-
   def get_value(self):
-    if self._widget:
-      return self._widget.GetValue()
     return self._value
 
   def set_value(self, value):
     value = str(value)
-    if self._widget:
-      self._widget.SetValue(value)
-    self._value = value
+    if value != self._value:
+      self._value = value
+      self._changed()
+
+  def _convert(self, value):
+    return str(value)
@@ -19,6 +19,8 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
+import collections
+import hashlib
 import nr.types
 import os
 import posixpath
@@ -27,10 +29,10 @@ import time
 import traceback
 import weakref
 from vizardry import gl
-from vizardry.core.generics.eventhandler import EventHandler
+from vizardry.core.generics.eventhandler import EventHandler, EventQueue
 from vizardry.core.generics.network import *
 from vizardry.core.interfaces import NodeBehaviour, GLObjectInterface
-from vizardry.core.parameters import Parameters
+from vizardry.core.parameters import AnimationBatch, Parameters
 
 
 class ChannelRef(nr.types.Named):
@@ -95,7 +97,7 @@ class _BaseList:
     return self._items[index]
 
   def __repr__(self):
-    return '{}({})'.format(type(self).__name__, self._outputs)
+    return '{}({})'.format(type(self).__name__, self._items)
 
   def clear(self):
     self._items.clear()
@@ -105,10 +107,11 @@ class OutputList(_BaseList):
 
   def add(self, *a, **kw):
     output = Output(*a, **kw)
-    for other in self._outputs:
+    for other in self._items:
       if other.name == output.name:
         raise ValueError('output already exists: {!r}'.format(output.name))
-    self._outputs.append(output)
+    self._items.append(output)
+    return output
 
 
 class InputList(_BaseList):
@@ -135,19 +138,35 @@ class Scene(Network):
   delta_time (float): The time passed since the last execution. The default
     value is 0.0.
   frame (int): The frame number. Defaults to 0.
+  event_queue (EventQueue): The queue that collects the events emitted by
+    the scene and the node parameters while the scene is #queued.
+  animation (AnimationBatch): Evaluates the keyframes of all animated
+    #Number parameters in the scene at the scene #time. This happens in
+    #gl_render() or when calling #evaluate_animation().
+
+  # Parameters
+  queued (bool): Initial value for the #queued property.
   """
 
   EV_VIEWPORT_UPDATE = 'Scene.EV_VIEWPORT_UPDATE'
   EV_FOCUS_PARAMETERS = 'Scene.EV_FOCUS_PARAMETERS'
   EV_ACTIVE_NODE_CHANGED = 'Scene.EV_ACTIVE_NODE_CHANGED'
 
+  #: Emitted with the data `{'node': node}` when a node, together with its
+  #: children, is detached from the scene. The node is the event source.
+  EV_NODE_REMOVED = 'Scene.EV_NODE_REMOVED'
+
   class RootBehaviour(nr.interface.Implementation):
     nr.interface.implements(NodeBehaviour)
 
-  def __init__(self):
+  def __init__(self, queued=False):
+    self.event_queue = EventQueue(active=queued)
+    self.animation = AnimationBatch()
     super().__init__(lambda s: SceneNode(s, 'root', self.RootBehaviour()))
     self.__active_node = None
-    self.__listeners = EventHandler()
+    self.__listeners = EventHandler(queue=self.event_queue)
+    self.__removed_nodes = collections.OrderedDict()
+    self.__render_caches = {}
     self.time = 0.0
     self.delta_time = 0.0
     self.frame = 0
@@ -168,43 +187,147 @@ class Scene(Network):
       data = {'new_node': node, 'old_node': old_node}
       self.emit(self.EV_ACTIVE_NODE_CHANGED, data)
 
+  @property
+  def queued(self):
+    """
+    If #True, events emitted with #emit() and by node parameters are
+    collected in the #event_queue and repeated events of the same kind and
+    source are merged into one. The application must call #flush_events()
+    once per frame to dispatch them. Otherwise, events are dispatched
+    immediately, except for events emitted from other threads which are
+    always collected.
+    """
+
+    return self.event_queue.active
+
+  @queued.setter
+  def queued(self, value):
+    if not value:
+      self.event_queue.flush()
+    self.event_queue.active = bool(value)
+
   def bind(self, *args, **kwargs):
-    self.__listeners.bind(*args, **kwargs)
+    """
+    Binds a listener to an event kind of the scene, see #EventHandler.bind().
+    Returns the listener object that can be passed to #unbind().
+    """
+
+    return self.__listeners.bind(*args, **kwargs)
+
+  def unbind(self, kind, listener, missing_ok=False):
+    """
+    Unbinds a listener that was returned by #bind().
+    """
+
+    self.__listeners.unbind(kind, listener, missing_ok)
 
   def emit(self, *args, **kwargs):
     self.__listeners.emit(*args, **kwargs)
 
-  def gl_render(self):
-    #for node in self.__removed_gl_nodes:
-    #  with node.behaviour.gl_resources.as_current(release=False):
-    #    try:
-    #      node.behaviour.gl_cleanup()
-    #    except:
-    #      traceback.print_exc()
-    #self.__removed_gl_nodes.clear()
-    #self.__new_gl_nodes.clear()
+  def flush_events(self, limit=None):
+    """
+    Dispatch the events that have been collected in the #event_queue,
+    including those emitted from background threads. Must be called from
+    the thread that created the scene. See #EventQueue.flush().
+    """
 
-    gl.glClearColor(0.0, 0.0, 0.0, 1.0)
-    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+    return self.event_queue.flush(limit)
 
-    for node in self.root.iter_hierarchy():
+  def evaluate_animation(self):
+    """
+    Evaluate all animated parameters in the scene at the current #time.
+    """
+
+    self.animation.evaluate(self.time)
+
+  def _node_detached(self, node):
+    self.__removed_nodes[node] = None
+    self.emit(self.EV_NODE_REMOVED, {'node': node}, node)
+
+  def _node_attached(self, node):
+    self.__removed_nodes.pop(node, None)
+
+  def __cleanup_removed_nodes(self):
+    """
+    Calls #GLObjectInterface.gl_cleanup() for all nodes that have been
+    removed from the scene since the last call. Deletions are collected in
+    the #gl.DeletionQueue of the context and executed in one batch.
+    """
+
+    removed, self.__removed_nodes = self.__removed_nodes, collections.OrderedDict()
+    with gl.DeletionQueue.deferring():
+      for node in removed:
+        if self.__is_attached(node):
+          continue
+        self.__gl_cleanup(node.iter_hierarchy())
+    gl.DeletionQueue.flush_current()
+
+  def __is_attached(self, node):
+    while node.parent is not None:
+      node = node.parent
+    return node is self.root
+
+  def __gl_cleanup(self, nodes):
+    for node in nodes:
+      cache = self.__render_caches.pop(node, None)
+      if cache is not None:
+        cache.release()
       if not node.implements(GLObjectInterface):
         continue
       with node.behaviour.gl_resources.as_current(release=False):
         try:
-          node.behaviour.gl_render()
+          node.behaviour.gl_cleanup()
         except:
           traceback.print_exc()
 
-  def gl_cleanup(self):
+  def gl_render(self):
+    # The application may have changed the GL state since the last frame.
+    gl.current_state().invalidate()
+    self.__cleanup_removed_nodes()
+    self.evaluate_animation()
+
+    gl.glClearColor(0.0, 0.0, 0.0, 1.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+    # Items that nodes submit to the render queue are drawn after all nodes
+    # have been rendered, sorted by their state.
+    queue = gl.RenderQueue.current()
+    queue.clear()
     for node in self.root.iter_hierarchy():
       if not node.implements(GLObjectInterface):
         continue
       with node.behaviour.gl_resources.as_current(release=False):
         try:
-          node.behaviour.gl_cleanup()
+          self.__gl_render_node(node)
         except:
           traceback.print_exc()
+    try:
+      queue.flush()
+    except:
+      traceback.print_exc()
+
+  def __gl_render_node(self, node):
+    key = node.behaviour.gl_cache_key()
+    if key is None:
+      cache = self.__render_caches.pop(node, None)
+      if cache is not None:
+        cache.release()
+      node.behaviour.gl_render()
+      return
+    cache = self.__render_caches.get(node)
+    if cache is None:
+      cache = self.__render_caches[node] = gl.RenderCache()
+    cache.draw(key, node.behaviour.gl_render)
+
+  def gl_cleanup(self):
+    self.__cleanup_removed_nodes()
+    self.__gl_cleanup(self.root.iter_hierarchy())
+    gl.RenderQueue.release_current()
+    gl.FullscreenQuad.release_current()
+    pool = gl.ResourcePool.current()
+    if pool is not None:
+      pool.clear()
+    gl.DeletionQueue.flush_current()
 
   # Network
 
@@ -241,7 +364,8 @@ class SceneNode(NetworkNode):
     if not NodeBehaviour.implemented_by(behaviour):
       raise TypeError('must implement the NodeBehaviour interface')
     self.__listeners = EventHandler()
-    self.params = Parameters()
+    self.__subtree_listeners = collections.Counter()
+    self.params = Parameters(network.event_queue, network.animation, self)
     self.inputs = InputList()
     self.outputs = OutputList()
     self.behaviour = behaviour
@@ -263,25 +387,57 @@ class SceneNode(NetworkNode):
 
     return self.network
 
-  def bind(self, kind, func, global_=False):
+  def bind(self, kind, func, global_=False, weak=False):
     """
     Bind a function to the specified event kind. If *global_* is #True, the
     listener will receive any events that are propagated through the
     hierarchy, otherwise it will only be invoked if the event was actually
-    emitted by the very node it was bound with.
+    emitted by the very node it was bound with. If *weak* is #True, the
+    listener only keeps a weak reference to *func* and is unbound
+    automatically when *func* is garbage collected.
+
+    Returns the listener object that can be passed to #unbind().
     """
 
     if global_:
       filter = None
     else:
       filter = lambda ev: ev.source == self
-    self.__listeners.bind(kind, func, filter=filter)
+    listener = self.__listeners.bind(kind, func, filter=filter, weak=weak)
+    if weak:
+      node = weakref.ref(self)
+      def on_expired(listener):
+        this = node()
+        if this is not None:
+          this.unbind(kind, listener, missing_ok=True)
+      listener.on_expired = on_expired
+    if global_:
+      self.__update_subtree_listeners({kind: 1})
+    return listener
+
+  def unbind(self, kind, listener, missing_ok=False):
+    """
+    Unbind a listener that was returned by #bind().
+    """
+
+    try:
+      self.__listeners.unbind(kind, listener)
+    except ValueError:
+      if not missing_ok:
+        raise
+    else:
+      if listener.filter is None:
+        self.__update_subtree_listeners({kind: -1})
 
   def emit(self, kind, data, direction=None, source=None):
     """
     Emit an event that propagates through the scene graph in the specified
     direction (either #EV_UP, #EV_DOWN or #EV_LOCAL). If no direction is
     specified, the event will propagate both up and down.
+
+    The event object is created only once. Propagating the event down the
+    hierarchy skips all branches that contain no global listeners for the
+    event kind.
     """
 
     if direction not in (None, self.EV_UP, self.EV_DOWN, self.EV_LOCAL):
@@ -289,15 +445,67 @@ class SceneNode(NetworkNode):
     if source is None:
       source = self
 
-    self.__listeners.emit(kind, data, source)
+    event = self.__listeners.event_class(kind, data, source)
+    self.__listeners.dispatch(event)
 
     if direction is None or direction == self.EV_UP:
       parent = self.parent
-      if parent:
-        parent.emit(kind, data, self.EV_UP, source)
+      while parent is not None:
+        parent.__listeners.dispatch(event)
+        parent = parent.parent
     if direction is None or direction == self.EV_DOWN:
-      for child in self.children:
-        child.emit(kind, data, self.EV_DOWN, source)
+      stack = [c for c in reversed(self.children)
+               if c.__has_subtree_listeners(kind)]
+      while stack:
+        node = stack.pop()
+        node.__listeners.dispatch(event)
+        stack.extend(c for c in reversed(node.children)
+                     if c.__has_subtree_listeners(kind))
+
+  def __has_subtree_listeners(self, kind):
+    counts = self.__subtree_listeners
+    return counts[kind] > 0 or counts[None] > 0
+
+  def __update_subtree_listeners(self, counts, node=None):
+    """
+    Adds *counts* to the global listener counts of *node* (defaults to this
+    node) and all of its parents.
+    """
+
+    node = self if node is None else node
+    while node is not None:
+      node.__subtree_listeners.update(counts)
+      node = node.parent
+
+  def fingerprint(self):
+    """
+    Returns a stable 64-bit hash of the node's parameters and, recursively,
+    the fingerprints of the nodes whose outputs are linked into its inputs.
+    The output values themselves are not hashed, thus this is as cheap as
+    #Parameters.fingerprint() and assumes that outputs only depend on the
+    parameters and inputs of their node. Nodes that only depend on these can
+    return it from #GLObjectInterface.gl_cache_key().
+    """
+
+    return self.__fingerprint(set())
+
+  def __fingerprint(self, visiting):
+    visiting.add(self)
+    hasher = hashlib.blake2b(digest_size=8)
+    hasher.update(self.params.fingerprint().to_bytes(8, 'little'))
+    for input in self.inputs:
+      if input.ref is None:
+        continue
+      hasher.update(input.name.encode('utf8'))
+      hasher.update(input.ref.channel.encode('utf8'))
+      node = self.find_node(input.ref.path)
+      if node is None or node in visiting:
+        # Unresolved links and cycles only contribute their name.
+        hasher.update(b'\0')
+        continue
+      hasher.update(node.__fingerprint(visiting).to_bytes(8, 'little'))
+    visiting.discard(self)
+    return int.from_bytes(hasher.digest(), 'little')
 
   def implements(self, interface):
     """
@@ -323,12 +531,17 @@ class SceneNode(NetworkNode):
     old_parent = self.parent
     super().detach()
     if old_parent is not None:
+      counts = {k: -v for k, v in self.__subtree_listeners.items()}
+      self.__update_subtree_listeners(counts, old_parent)
+      self.network._node_detached(self)
       data = {'new_parent': None, 'old_parent': old_parent}
       self.emit(self.EV_PARENT_CHANGED, data)
 
   def attach_to(self, parent, *args, **kwargs):
     old_parent = self.parent
     super().attach_to(parent, *args, **kwargs)
+    self.__update_subtree_listeners(self.__subtree_listeners, parent)
+    self.network._node_attached(self)
     if old_parent != parent:
       data = {'new_parent': parent, 'old_parent': old_parent}
       self.emit(self.EV_PARENT_CHANGED, data)
@@ -350,6 +563,7 @@ class SceneTimer:
     self.last_time = None
 
   def begin_frame(self):
+    self.scene.flush_events()
     current = time.clock()
     if self.start_time is None:
       self.start_time = current
@@ -24,4 +24,10 @@ A high-level object-oriented interface to OpenGL.
 """
 
 from .api import *
+from .binarycache import *
 from .oop import *
+from .offscreen import *
+from .quad import *
+from .recorder import *
+from .renderqueue import *
+from .state import *
@@ -0,0 +1,153 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""
+An on-disk cache for linked program binaries (see `glGetProgramBinary()`).
+Binaries are only valid for the driver that produced them, thus the cache
+key includes the GL vendor, renderer and version strings in addition to the
+shader sources.
+
+The default cache directory is `$XDG_CACHE_HOME/vizardry/programs`. It can
+be changed with the `VIZARDRY_PROGRAM_CACHE` environment variable, an empty
+value disables the cache.
+"""
+
+__all__ = ['ProgramBinaryCache', 'get_default_cache']
+
+from .api import *
+
+import hashlib
+import os
+import struct
+import tempfile
+
+_MAGIC = b'VZPB'
+_HEADER = struct.Struct('<4sI')
+
+
+def _decode(x):
+  if hasattr(x, 'decode'):
+    return x.decode()
+  return x
+
+
+def driver_info():
+  """
+  Returns a tuple of the vendor, renderer and version strings of the
+  current OpenGL context.
+  """
+
+  return tuple(_decode(glGetString(x) or b'') for x in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+
+
+class ProgramBinaryCache:
+  """
+  Stores program binaries as files in *directory*. The directory is created
+  when the first binary is stored.
+  """
+
+  def __init__(self, directory):
+    self.directory = directory
+
+  def __repr__(self):
+    return 'ProgramBinaryCache({!r})'.format(self.directory)
+
+  @staticmethod
+  def make_key(sources, driver):
+    """
+    Computes the cache key for a program linked from *sources*, a sequence
+    of `(shader_type, shader_source)` tuples, with the *driver* returned by
+    #driver_info().
+    """
+
+    hasher = hashlib.blake2b(digest_size=20)
+    for value in driver:
+      hasher.update(value.encode('utf8') + b'\0')
+    for shader_type, source in sources:
+      hasher.update(struct.pack('<I', int(shader_type)))
+      hasher.update(source.encode('utf8') + b'\0')
+    return hasher.hexdigest()
+
+  def filename(self, key):
+    return os.path.join(self.directory, key + '.bin')
+
+  def load(self, key):
+    """
+    Returns a tuple of the binary format and the binary data stored under
+    *key*, or #None if there is no valid entry.
+    """
+
+    try:
+      with open(self.filename(key), 'rb') as fp:
+        data = fp.read()
+    except OSError:
+      return None
+    if len(data) < _HEADER.size:
+      return None
+    magic, binary_format = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+      return None
+    return binary_format, data[_HEADER.size:]
+
+  def store(self, key, binary_format, binary):
+    """
+    Stores a program *binary* under *key*. The file is replaced atomically,
+    thus concurrent processes never read a partially written binary. Errors
+    are ignored as the cache is only an optimization.
+    """
+
+    try:
+      os.makedirs(self.directory, exist_ok=True)
+      fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+      try:
+        with os.fdopen(fd, 'wb') as fp:
+          fp.write(_HEADER.pack(_MAGIC, binary_format))
+          fp.write(binary)
+        os.replace(tmp, self.filename(key))
+      except:
+        os.remove(tmp)
+        raise
+    except OSError:
+      return False
+    return True
+
+  def remove(self, key):
+    try:
+      os.remove(self.filename(key))
+    except OSError:
+      pass
+
+
+def get_default_cache():
+  """
+  Returns the #ProgramBinaryCache for the directory configured with the
+  `VIZARDRY_PROGRAM_CACHE` environment variable, or #None if the cache
+  is disabled.
+  """
+
+  directory = os.environ.get('VIZARDRY_PROGRAM_CACHE')
+  if directory is None:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    directory = os.path.join(base, 'vizardry', 'programs')
+  if not directory:
+    return None
+  return ProgramBinaryCache(directory)
@@ -0,0 +1,303 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""
+Rendering into offscreen framebuffers and reading the results back into
+NumPy arrays.
+"""
+
+__all__ = ['RenderTarget', 'RenderCache', 'AsyncReadback']
+
+from .api import *
+from .oop import GLError, ResourceManager, Buffer, Framebuffer, Program, \
+  Texture, TEXTURE_FORMATS, _PIXEL_CHANNELS, _PIXEL_DTYPES
+from .quad import draw_fullscreen_quad
+from .renderqueue import RenderQueue
+from .state import current_state
+
+import collections
+import contextlib
+import ctypes
+import numpy
+
+
+class RenderTarget:
+  """
+  A framebuffer with a color texture of *width* x *height* texels and the
+  *color_format*, and optionally a depth texture. The GL objects are taken
+  from the #ResourcePool and owned by the target's own #ResourceManager,
+  call #release() when the target is no longer needed.
+  """
+
+  def __init__(self, width, height, color_format=GL_RGBA8, depth=True):
+    self.width = width
+    self.height = height
+    self.resources = ResourceManager()
+    with self.resources.as_current(release=False, replace=True):
+      self.framebuffer = Framebuffer.pooled()
+      self.color = Texture.pooled(width, height, color_format)
+      self.depth = Texture.pooled(width, height, GL_DEPTH_COMPONENT24) if depth else None
+    with self.bound():
+      self.framebuffer.attach(self.color, GL_COLOR_ATTACHMENT0)
+      # Pooled framebuffers may still have an attachment from before.
+      self.framebuffer.attach(self.depth or 0, GL_DEPTH_ATTACHMENT)
+      status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+    if status != GL_FRAMEBUFFER_COMPLETE:
+      self.release()
+      raise GLError('framebuffer incomplete (status 0x{:x})'.format(int(status)))
+
+  @contextlib.contextmanager
+  def bound(self):
+    """
+    Binds the framebuffer and sets the viewport to its size. The previous
+    framebuffer and viewport are restored on exit, thus rendering into a
+    target while another one is bound works as expected.
+    """
+
+    viewport = glGetIntegerv(GL_VIEWPORT)
+    previous = int(glGetIntegerv(GL_FRAMEBUFFER_BINDING))
+    state = current_state()
+    state.bind_framebuffer(GL_FRAMEBUFFER, self.framebuffer)
+    glViewport(0, 0, self.width, self.height)
+    try:
+      yield self
+    finally:
+      current_state().bind_framebuffer(GL_FRAMEBUFFER, previous)
+      glViewport(*viewport)
+
+  def render(self, scene):
+    """
+    Renders the #Scene into the target.
+    """
+
+    with self.bound():
+      scene.gl_render()
+
+  def read(self):
+    """
+    Reads the color texture synchronously. Returns a NumPy array of shape
+    `(height, width, channels)` with the bottom row first.
+    """
+
+    return self.color.read()
+
+  def release(self):
+    self.resources.release()
+
+
+class RenderCache:
+  """
+  Keeps the output of a render function in a #RenderTarget of the size of
+  the current viewport, and only renders it again when the cache key
+  changes. In between, the cached image is composited into the currently
+  bound framebuffer.
+
+  The render function draws into a transparent target, and the result is
+  composited with premultiplied alpha blending. This is exact for opaque
+  output and for output that was drawn without blending. Depth is not
+  composited.
+
+  # Members
+  renders (int): The number of times the render function was called.
+  """
+
+  COMPOSITE_SHADER = '''
+    #version 330 core
+    uniform sampler2D image;
+    in vec2 fragCoord;
+    out vec4 fragColor;
+    void main() {
+      fragColor = texture(image, fragCoord);
+    }
+  '''
+
+  def __init__(self):
+    self.resources = ResourceManager()
+    self.target = None
+    self.key = None
+    self.renders = 0
+    self._program = None
+
+  def draw(self, key, render):
+    """
+    Composites the cached image into the current framebuffer. If *key* is
+    not equal to the key that the image was rendered with, or the size of
+    the viewport changed, *render* is called first to render it again.
+    Items that *render* submits to the #RenderQueue are drawn into the
+    cache, too.
+    """
+
+    viewport = glGetIntegerv(GL_VIEWPORT)
+    size = (int(viewport[2]), int(viewport[3]))
+    if self.target is None or (self.target.width, self.target.height) != size:
+      if self.target is not None:
+        self.target.release()
+      self.target = RenderTarget(size[0], size[1])
+      self.key = None
+
+    if self.key is None or key != self.key:
+      # Not valid until the render function succeeded.
+      self.key = None
+      with self.target.bound():
+        glClearColor(0.0, 0.0, 0.0, 0.0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        with RenderQueue.current().section():
+          render()
+      self.key = key
+      self.renders += 1
+
+    self.composite()
+
+  def composite(self):
+    """
+    Draws the cached image over the currently bound framebuffer.
+    """
+
+    if self._program is None:
+      with self.resources.as_current(release=False, replace=True):
+        self._program = Program.from_fragment(self.COMPOSITE_SHADER)
+    state = current_state()
+    self._program.use()
+    self._program.set_int('image', 0)
+    self.target.color.bind(0)
+    state.enable(GL_BLEND)
+    state.blend_func(GL_ONE, GL_ONE_MINUS_SRC_ALPHA)
+    state.disable(GL_DEPTH_TEST)
+    draw_fullscreen_quad()
+    state.disable(GL_BLEND)
+
+  def invalidate(self):
+    """
+    Renders the image again on the next #draw().
+    """
+
+    self.key = None
+
+  def release(self):
+    if self.target is not None:
+      self.target.release()
+      self.target = None
+    self.resources.release()
+    self._program = None
+    self.key = None
+
+
+class AsyncReadback:
+  """
+  Reads the color attachment of a #RenderTarget through a ring of *count*
+  pixel pack buffers. #start() only issues the transfer into the next
+  buffer and returns the result of the oldest transfer once all buffers are
+  in use, thus reading frame N overlaps with rendering frame N+1.
+
+  ```python
+  readback = AsyncReadback(target)
+  for frame in frames:
+    target.render(scene)
+    result = readback.start(frame)
+    if result:
+      save(*result)
+  for result in readback.finish():
+    save(*result)
+  ```
+  """
+
+  def __init__(self, target, count=2):
+    self.target = target
+    pixel_format, pixel_type = TEXTURE_FORMATS[target.color.internal_format]
+    self.pixel_format = pixel_format
+    self.pixel_type = pixel_type
+    self.shape = (target.height, target.width, _PIXEL_CHANNELS[pixel_format])
+    self.dtype = _PIXEL_DTYPES[pixel_type]
+    size = int(numpy.prod(self.shape)) * self.dtype.itemsize
+    with target.resources.as_current(release=False, replace=True):
+      self.buffers = [Buffer.pooled(size, GL_STREAM_READ, GL_PIXEL_PACK_BUFFER)
+        for _ in range(count)]
+    self._free = collections.deque(self.buffers)
+    self._pending = collections.deque()
+
+  def __len__(self):
+    return len(self._pending)
+
+  def start(self, tag=None):
+    """
+    Starts reading the current content of the target. Returns a tuple of
+    the *tag* and the NumPy array of the oldest pending transfer if no
+    buffer was free, otherwise #None.
+    """
+
+    result = None
+    if not self._free:
+      result = self._finish_oldest()
+    buffer = self._free.popleft()
+    state = current_state()
+    state.bind_framebuffer(GL_READ_FRAMEBUFFER, self.target.framebuffer)
+    state.bind_buffer(GL_PIXEL_PACK_BUFFER, buffer)
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    glReadPixels(0, 0, self.target.width, self.target.height,
+      self.pixel_format, self.pixel_type, ctypes.c_void_p(0))
+    state.bind_buffer(GL_PIXEL_PACK_BUFFER, 0)
+    state.bind_framebuffer(GL_READ_FRAMEBUFFER, 0)
+    fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+    self._pending.append((buffer, fence, tag))
+    return result
+
+  def poll(self):
+    """
+    Returns the results of all pending transfers that have completed,
+    without waiting for the others.
+    """
+
+    results = []
+    while self._pending:
+      status = glClientWaitSync(self._pending[0][1], 0, 0)
+      if status not in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED):
+        break
+      results.append(self._finish_oldest())
+    return results
+
+  def finish(self):
+    """
+    Waits for and returns the results of all pending transfers.
+    """
+
+    results = []
+    while self._pending:
+      results.append(self._finish_oldest())
+    return results
+
+  def _finish_oldest(self):
+    buffer, fence, tag = self._pending.popleft()
+    glDeleteSync(fence)
+    current_state().bind_buffer(GL_PIXEL_PACK_BUFFER, buffer)
+    try:
+      address = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, buffer.size, GL_MAP_READ_BIT)
+      if not address:
+        raise GLError('glMapBufferRange() failed')
+      try:
+        mapped = (ctypes.c_ubyte * buffer.size).from_address(address)
+        array = numpy.frombuffer(mapped, self.dtype).reshape(self.shape).copy()
+      finally:
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+    finally:
+      current_state().bind_buffer(GL_PIXEL_PACK_BUFFER, 0)
+      self._free.append(buffer)
+    return tag, array
@@ -23,11 +23,21 @@
 Object wrappers for GL resources.
 """
 
-__all__ = ['GLError', 'ResourceManager', 'Program', 'Shader']
+__all__ = ['GLError', 'DeletionQueue', 'ResourceManager', 'ResourcePool',
+  'Buffer', 'Framebuffer', 'Program', 'Shader', 'Texture', 'TextureStream',
+  'TEXTURE_FORMATS', 'pixel_format']
 
 from .api import *
+from .binarycache import driver_info, get_default_cache
+from .state import current_state
+from OpenGL import contextdata, error as gl_error
 
+import collections
 import contextlib
+import ctypes
+import hashlib
+import numpy
+import threading
 import warnings
 import weakref
 
@@ -38,15 +48,205 @@ def _decode(x):
   return x
 
 
+def _source_hash(source):
+  if isinstance(source, str):
+    source = source.encode('utf8')
+  return hashlib.blake2b(source, digest_size=16).hexdigest()
+
+
+def _shared_handles():
+  """
+  Returns the dictionary of shared handles of the current OpenGL context.
+  """
+
+  handles = contextdata.getValue(_shared_handles)
+  if handles is None:
+    handles = {}
+    contextdata.setValue(_shared_handles, handles)
+  return handles
+
+
 class GLError(RuntimeError):
   pass
 
 
+def _current_context():
+  """
+  Returns the OpenGL context that is current in this thread, or #None.
+  """
+
+  try:
+    return contextdata.getContext()
+  except gl_error.Error:
+    return None
+
+
+class DeletionQueue:
+  """
+  Collects the OpenGL handles of one context whose deletion was requested
+  while the context is not current in the calling thread, eg. from another
+  thread or by the garbage collector, or while deletions are explicitly
+  #deferring(). #flush() deletes the handles with one call per handle type
+  and must be called while the context is current. The #Scene does that in
+  #Scene.gl_render().
+
+  Use #current() or #of() to get the queue of a context. The queues are
+  stored with #OpenGL.contextdata like the #ResourcePool.
+  """
+
+  _local = threading.local()
+  _create_lock = threading.Lock()
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._handles = collections.defaultdict(list)
+
+  def __len__(self):
+    with self._lock:
+      return sum(len(x) for x in self._handles.values())
+
+  @classmethod
+  def of(cls, context):
+    """
+    Returns the #DeletionQueue of the OpenGL *context*, creating it if it
+    does not exist yet. Can be called from any thread.
+    """
+
+    with cls._create_lock:
+      queue = contextdata.getValue(cls, context)
+      if queue is None:
+        queue = cls()
+        contextdata.setValue(cls, queue, context)
+    return queue
+
+  @classmethod
+  def current(cls):
+    """
+    Returns the #DeletionQueue of the current context, or #None if no
+    context is current in this thread.
+    """
+
+    context = _current_context()
+    return None if context is None else cls.of(context)
+
+  @classmethod
+  def flush_current(cls):
+    """
+    Flushes the queue of the current context, if a context is current.
+    """
+
+    queue = cls.current()
+    return queue.flush() if queue is not None else 0
+
+  @classmethod
+  def is_deferring(cls):
+    return getattr(cls._local, 'depth', 0) > 0
+
+  @classmethod
+  @contextlib.contextmanager
+  def deferring(cls):
+    """
+    Handles that are released in the current thread inside this context
+    manager are added to the queue of their context instead of being
+    deleted immediately.
+    """
+
+    cls._local.depth = getattr(cls._local, 'depth', 0) + 1
+    try:
+      yield
+    finally:
+      cls._local.depth -= 1
+
+  def add(self, handle_type, handle):
+    with self._lock:
+      self._handles[handle_type].append(int(handle))
+
+  def flush(self):
+    """
+    Deletes all queued handles. Returns the number of deleted handles.
+    """
+
+    with self._lock:
+      handles, self._handles = self._handles, collections.defaultdict(list)
+    for handle_type, values in handles.items():
+      handle_type._delete(values)
+    return sum(len(x) for x in handles.values())
+
+
+class ResourcePool:
+  """
+  Keeps released handles of the current OpenGL context that can be reused
+  by handles of the same type, size and format (see eg. #Texture.pooled()).
+  At most #max_per_key handles are kept per key.
+  """
+
+  max_per_key = 4
+
+  def __init__(self):
+    self._free = collections.defaultdict(list)
+
+  def __len__(self):
+    return sum(len(x) for x in self._free.values())
+
+  @classmethod
+  def current(cls):
+    """
+    Returns the #ResourcePool of the current OpenGL context, or #None if no
+    context is current in this thread.
+    """
+
+    try:
+      pool = contextdata.getValue(cls)
+    except gl_error.Error:
+      return None
+    if pool is None:
+      pool = cls()
+      contextdata.setValue(cls, pool)
+    return pool
+
+  def take(self, key):
+    """
+    Removes a handle for *key* from the pool and returns it, or returns
+    #None if there is none.
+    """
+
+    free = self._free.get(key)
+    return free.pop() if free else None
+
+  def put(self, handle):
+    """
+    Adds the pooled *handle* to the pool. Returns #False if the pool for the
+    handle's key is full, in which case the handle must be released.
+    """
+
+    free = self._free[handle._pool_key]
+    if len(free) >= self.max_per_key or not handle:
+      return False
+    handle._refs = 0
+    free.append(handle)
+    return True
+
+  def clear(self):
+    """
+    Releases all handles in the pool.
+    """
+
+    for free in self._free.values():
+      for handle in free:
+        handle.release()
+    self._free.clear()
+
+
 class ResourceManager:
   """
   A resource manager is supposed to keep track of a set of OpenGL handles.
   Note that when you create a #_GLHandle, it will add itself to the resource
   manager automatically.
+
+  All #_GLHandle subclasses are available as attributes by their name, eg.
+  `manager.Shader(...)` creates a #Shader with the manager temporarily made
+  current, so the handle is registered with this manager only, regardless
+  of which manager (if any) is current.
   """
 
   class _ResourceTypeProxy:
@@ -54,46 +254,76 @@ class ResourceManager:
       self._manager = manager
       self._cls = cls
     def __call__(self, *args, **kwargs):
-      handle = self._cls(*args, **kwargs)
-      self._manager.register_handle(handle)
-      return handle
+      with self._manager.as_current(release=False, replace=True):
+        return self._cls(*args, **kwargs)
     def __getattr__(self, name):
       value = getattr(self._cls, name)
       if callable(value):
-        return ResourceManager._ResourceTypeProxy(self._manager, value)
+        value = ResourceManager._ResourceTypeProxy(self._manager, value)
+        self.__dict__[name] = value
       return value
 
   def __init__(self):
     self._handles = set()
 
   def __getattr__(self, name):
-    for subclass in _GLHandle.__subclasses__():
-      if subclass.__name__ == name:
-        return self._ResourceTypeProxy(self, subclass)
-    raise AttributeError(name)
+    try:
+      cls = _GLHandle._types[name]
+    except KeyError:
+      raise AttributeError(name)
+    # Cache the proxy so further lookups don't reach __getattr__().
+    proxy = self.__dict__[name] = self._ResourceTypeProxy(self, cls)
+    return proxy
 
   def register_handle(self, handle):
     if not isinstance(handle, _GLHandle):
       raise TypeError('expected _GLHandle')
+    if handle in self._handles:
+      return
     handle._resource_manager = weakref.ref(self)
+    handle._refs += 1
     self._handles.add(handle)
 
   def release(self):
+    """
+    Releases all handles registered with the manager. Shared handles are
+    only released when no other manager references them anymore. Pooled
+    handles are returned to the #ResourcePool if their context is current,
+    otherwise they are released like other handles.
+    """
+
+    context = _current_context()
+    pool = None
     for handle in self._handles:
+      if handle._shared_key is not None:
+        handle._unref()
+        continue
+      if handle._pool_key is not None and handle._context == context:
+        if pool is None:
+          pool = ResourcePool.current()
+        if pool is not None and pool.put(handle):
+          continue
       handle.release()
     self._handles.clear()
 
   current = None
 
   @contextlib.contextmanager
-  def as_current(self, release=True):
-    if ResourceManager.current is not None:
+  def as_current(self, release=True, replace=False):
+    """
+    Makes this the current resource manager. Unless *replace* is #True, no
+    other resource manager may be current. Otherwise, the previously current
+    manager is restored on exit.
+    """
+
+    previous = ResourceManager.current
+    if previous is not None and not replace:
       raise RuntimeError('another ResourceManager is current')
     ResourceManager.current = self
     try:
       yield self
     finally:
-      ResourceManager.current = None
+      ResourceManager.current = previous
       if release:
         self.release()
 
@@ -107,22 +337,44 @@ class ResourceManager:
 
 class _GLHandle:
   """
-  Base class for OpenGL handles. Subclasses must implement the #release()
-  method that should delete the OpenGL handle.
+  Base class for OpenGL handles. Subclasses must implement the
+  #_delete_handles() static method that deletes a list of OpenGL handles
+  of their type.
   """
 
   _handle = 0
+  _refs = 0
+  _shared_key = None
+  _pool_key = None
+  _context = None
+
+  #: The kind of binding that the #StateTracker must forget when a handle
+  #: of this type is deleted, see #StateTracker.forget().
+  _binding_kind = None
+
+  #: Maps the names of all subclasses, including indirect ones, to the
+  #: class. If two subclasses have the same name, the latter wins.
+  _types = {}
+
+  def __init_subclass__(cls, **kwargs):
+    super().__init_subclass__(**kwargs)
+    _GLHandle._types[cls.__name__] = cls
 
   def __new__(cls, *args, **kwargs):
     if not ResourceManager.current:
       raise RuntimeError('no active ResourceManager')
     self = object.__new__(cls)
+    self._context = _current_context()
     ResourceManager.current.register_handle(self)
     return self
 
   def __del__(self):
     if self._handle != 0:
       warnings.warn('{!r} has not been released before GC.'.format(self), RuntimeWarning)
+      try:
+        DeletionQueue.of(self._context).add(type(self), self._handle)
+      except Exception:
+        pass  # eg. no context, or OpenGL.contextdata was torn down at exit
 
   def __bool__(self):
     return self._handle != 0
@@ -143,8 +395,84 @@ class _GLHandle:
     return self._resource_manager()
 
   def release(self):
+    """
+    Deletes the OpenGL handle. If the handle's context is not current in
+    this thread, or deletions are #DeletionQueue.deferring(), the handle is
+    added to the #DeletionQueue of its context instead.
+    """
+
+    if self._handle != 0:
+      deferred = DeletionQueue.is_deferring() or (self._context is not None
+        and _current_context() != self._context)
+      if deferred:
+        DeletionQueue.of(self._context).add(type(self), self._handle)
+      else:
+        type(self)._delete([self._handle])
+      self._handle = 0
+
+  @classmethod
+  def _delete(cls, handles):
+    cls._delete_handles(handles)
+    if cls._binding_kind is not None:
+      state = current_state(create=False)
+      if state is not None:
+        state.forget(cls._binding_kind, handles)
+
+  @staticmethod
+  def _delete_handles(handles):
     raise NotImplementedError
 
+  @classmethod
+  def _get_pooled(cls, key, factory):
+    """
+    Returns a handle for *key* from the #ResourcePool of the current context,
+    or creates it by calling *factory*. The handle is registered with the
+    current #ResourceManager and returns to the pool when the manager is
+    released.
+    """
+
+    manager = ResourceManager.current
+    if not manager:
+      raise RuntimeError('no active ResourceManager')
+    pool = ResourcePool.current()
+    handle = pool.take(key) if pool is not None else None
+    if handle is not None:
+      manager.register_handle(handle)
+    else:
+      handle = factory()
+      handle._pool_key = key
+    return handle
+
+  @classmethod
+  def _get_shared(cls, key, factory):
+    """
+    Returns the handle that is shared under *key* in the current OpenGL
+    context, or creates it by calling *factory*. The handle is registered
+    with the current #ResourceManager and will be released when the last
+    manager that it is registered with is released.
+    """
+
+    manager = ResourceManager.current
+    if not manager:
+      raise RuntimeError('no active ResourceManager')
+    handles = _shared_handles()
+    handle = handles.get(key)
+    if handle:
+      manager.register_handle(handle)
+    else:
+      handle = factory()
+      handle._shared_key = key
+      handles[key] = handle
+    return handle
+
+  def _unref(self):
+    self._refs -= 1
+    if self._refs <= 0:
+      handles = contextdata.getValue(_shared_handles, self._context) or {}
+      if handles.get(self._shared_key) is self:
+        del handles[self._shared_key]
+      self.release()
+
   @property
   def _as_parameter_(self):
     return ctypes.c_uint(self._handle)
@@ -160,6 +488,17 @@ class Shader(_GLHandle):
     if shader_source:
       self.compile(shader_source)
 
+  @classmethod
+  def cached(cls, shader_type, shader_source):
+    """
+    Returns a compiled shader of the specified *shader_type* and source
+    code. Shaders are shared by all resource managers of the current
+    OpenGL context, thus identical sources are compiled only once.
+    """
+
+    key = ('shader', shader_type, _source_hash(shader_source))
+    return cls._get_shared(key, lambda: cls(shader_type, shader_source))
+
   @property
   def log(self):
     return self._log or ''
@@ -173,16 +512,32 @@ class Shader(_GLHandle):
     if self._log and 'error' in self._log:
       raise GLError(self._log)
 
-  def release(self):
-    if self._handle != 0:
-      glDeleteShader(self)
-      self._handle = 0
+  @staticmethod
+  def _delete_handles(handles):
+    for handle in handles:
+      glDeleteShader(handle)
 
 
 class Program(_GLHandle):
 
+  #: The vertex shader used by #from_fragment().
+  FRAGMENT_VERTEX_SHADER = '''
+    #version 330 core
+    layout(location = 0) in vec2 position;
+    out vec2 fragCoord;
+    void main() {
+      gl_Position = vec4(position, 0.0, 1.0);
+      fragCoord = (position + 1) * 0.5;
+    }
+  '''
+
+  #: The #ProgramBinaryCache that is used by #cached(), or #None.
+  binary_cache = get_default_cache()
+
   def __init__(self, *shaders):
     self._log = None
+    self._uniforms = {}
+    self._uniform_values = {}
     self._handle = glCreateProgram()
     if self._handle == 0:
       raise GLError('glCreateProgram() failed')
@@ -191,21 +546,87 @@ class Program(_GLHandle):
 
   @classmethod
   def from_fragment(cls, fragment):
-    with ResourceManager().as_autorelease() as temp_manager:
-      if isinstance(fragment, str):
-        fragment = temp_manager.Shader(GL_FRAGMENT_SHADER, fragment)
-
-      vertex = temp_manager.Shader(GL_VERTEX_SHADER, '''
-        #version 330 core
-        layout(location = 0) in vec2 position;
-        out vec2 fragCoord;
-        void main() {
-          gl_Position = vec4(position, 0.0, 1.0);
-          fragCoord = (position + 1) * 0.5;
-        }
-      ''')
-
-      return cls(vertex, fragment)
+    """
+    Creates a program from the *fragment* shader (either a #Shader or
+    source code) and the #FRAGMENT_VERTEX_SHADER. If source code is
+    passed, the program is shared like with #cached().
+    """
+
+    if isinstance(fragment, str):
+      return cls.cached((GL_VERTEX_SHADER, cls.FRAGMENT_VERTEX_SHADER),
+        (GL_FRAGMENT_SHADER, fragment))
+    return cls(Shader.cached(GL_VERTEX_SHADER, cls.FRAGMENT_VERTEX_SHADER), fragment)
+
+  @classmethod
+  def cached(cls, *sources):
+    """
+    Returns a program linked from shaders that are specified as
+    `(shader_type, shader_source)` tuples. The program and its shaders are
+    shared by all resource managers of the current OpenGL context, thus a
+    program is only linked once for the same set of sources.
+    """
+
+    key = ('program',) + tuple((t, _source_hash(s)) for t, s in sources)
+    def factory():
+      cache = cls.binary_cache
+      if cache is None or not cls.binaries_supported():
+        return cls(*[Shader.cached(t, s) for t, s in sources])
+      binary_key = cache.make_key(sources, driver_info())
+      program = cls()
+      entry = cache.load(binary_key)
+      if entry is not None:
+        if program.load_binary(*entry):
+          return program
+        # Stale or foreign entry, it is replaced below.
+        cache.remove(binary_key)
+      glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+      program.link(*[Shader.cached(t, s) for t, s in sources])
+      cache.store(binary_key, *program.get_binary())
+      return program
+    return cls._get_shared(key, factory)
+
+  @staticmethod
+  def binaries_supported():
+    """
+    Returns #True if the current context supports loading and retrieving
+    program binaries.
+    """
+
+    if not (glGetProgramBinary and glProgramBinary):
+      return False
+    return glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+
+  def get_binary(self):
+    """
+    Returns a tuple of the binary format and the binary data of the linked
+    program. The #GL_PROGRAM_BINARY_RETRIEVABLE_HINT should be set before
+    the program is linked.
+    """
+
+    size = glGetProgramiv(self, GL_PROGRAM_BINARY_LENGTH)
+    length = numpy.zeros(1, numpy.int32)
+    binary_format = numpy.zeros(1, numpy.uint32)
+    binary = numpy.zeros(size, numpy.uint8)
+    glGetProgramBinary(self, size, length, binary_format, binary)
+    return int(binary_format[0]), binary[:length[0]].tobytes()
+
+  def load_binary(self, binary_format, binary):
+    """
+    Loads a program binary returned by #get_binary(). Returns #False if the
+    driver rejected the binary, eg. because the driver was updated. The
+    program can still be linked from source afterwards.
+    """
+
+    try:
+      glProgramBinary(self, binary_format, binary, len(binary))
+    except gl_error.GLError:
+      # Raised for binary formats that the driver does not support.
+      return False
+    if not glGetProgramiv(self, GL_LINK_STATUS):
+      return False
+    self._log = None
+    self._update_uniforms()
+    return True
 
   @property
   def log(self):
@@ -224,8 +645,456 @@ class Program(_GLHandle):
     self._log = _decode(glGetProgramInfoLog(self))
     if self._log and 'error' in self._log:
       raise GLError(self._log)
+    self._update_uniforms()
+
+  def _update_uniforms(self):
+    """
+    Fills the uniform location table from the program's active uniforms.
+    Arrays are available under their name with and without the `[0]`
+    suffix.
+    """
+
+    self._uniforms.clear()
+    self._uniform_values.clear()
+    for index in range(glGetProgramiv(self, GL_ACTIVE_UNIFORMS)):
+      name = _decode(glGetActiveUniform(self, index)[0])
+      location = glGetUniformLocation(self, name)
+      if location < 0:
+        continue  # eg. uniforms in a uniform block
+      self._uniforms[name] = location
+      if name.endswith('[0]'):
+        self._uniforms[name[:-3]] = location
+
+  def use(self):
+    """
+    Makes this the current program through the #StateTracker.
+    """
+
+    current_state().use_program(self)
+
+  @property
+  def uniforms(self):
+    """
+    A dictionary that maps the names of the program's active uniforms to
+    their locations.
+    """
+
+    return self._uniforms
+
+  def uniform_location(self, name):
+    """
+    Returns the location of the uniform *name*, or -1 if the program has
+    no active uniform with that name.
+    """
+
+    return self._uniforms.get(name, -1)
+
+  def _set_uniform(self, name, func, value):
+    location = self._uniforms.get(name, -1)
+    if location < 0 or self._uniform_values.get(location) == value:
+      return False
+    func(location, *value)
+    self._uniform_values[location] = value
+    return True
+
+  # The setters below upload the value to the uniform *name* of the program
+  # that must currently be in use. The last uploaded value is remembered and
+  # the upload is skipped if the value did not change. The methods return
+  # #True if the value was uploaded. Note that values uploaded with the
+  # glUniform*() functions directly are not known to the #Program.
+
+  def set_int(self, name, value):
+    return self._set_uniform(name, glUniform1i, (int(value),))
+
+  def set_float(self, name, value):
+    return self._set_uniform(name, glUniform1f, (float(value),))
+
+  def set_vec2(self, name, x, y):
+    return self._set_uniform(name, glUniform2f, (float(x), float(y)))
+
+  def set_vec3(self, name, x, y, z):
+    return self._set_uniform(name, glUniform3f, (float(x), float(y), float(z)))
+
+  def set_vec4(self, name, x, y, z, w):
+    return self._set_uniform(name, glUniform4f, (float(x), float(y), float(z), float(w)))
+
+  def set_mat4(self, name, matrix):
+    """
+    Uploads a 4x4 *matrix* in row-major order.
+    """
+
+    value = tuple(float(x) for x in numpy.asarray(matrix).ravel())
+    if len(value) != 16:
+      raise ValueError('expected 4x4 matrix')
+    upload = lambda location, *value: glUniformMatrix4fv(location, 1, GL_TRUE, value)
+    return self._set_uniform(name, upload, value)
+
+  @staticmethod
+  def _delete_handles(handles):
+    for handle in handles:
+      glDeleteProgram(handle)
+
+
+#: Maps sized internal texture formats to the pixel format and type that are
+#: used to allocate the texture storage.
+TEXTURE_FORMATS = {
+  GL_R8: (GL_RED, GL_UNSIGNED_BYTE),
+  GL_RG8: (GL_RG, GL_UNSIGNED_BYTE),
+  GL_RGB8: (GL_RGB, GL_UNSIGNED_BYTE),
+  GL_RGBA8: (GL_RGBA, GL_UNSIGNED_BYTE),
+  GL_R16F: (GL_RED, GL_HALF_FLOAT),
+  GL_RGBA16F: (GL_RGBA, GL_HALF_FLOAT),
+  GL_R32F: (GL_RED, GL_FLOAT),
+  GL_RG32F: (GL_RG, GL_FLOAT),
+  GL_RGB32F: (GL_RGB, GL_FLOAT),
+  GL_RGBA32F: (GL_RGBA, GL_FLOAT),
+  GL_DEPTH_COMPONENT24: (GL_DEPTH_COMPONENT, GL_UNSIGNED_INT),
+  GL_DEPTH_COMPONENT32F: (GL_DEPTH_COMPONENT, GL_FLOAT),
+}
+
+_PIXEL_FORMATS = {1: GL_RED, 2: GL_RG, 3: GL_RGB, 4: GL_RGBA}
+_PIXEL_CHANNELS = {v: k for k, v in _PIXEL_FORMATS.items()}
+_PIXEL_CHANNELS[GL_DEPTH_COMPONENT] = 1
+
+_PIXEL_TYPES = {
+  numpy.dtype(numpy.uint8): GL_UNSIGNED_BYTE,
+  numpy.dtype(numpy.uint16): GL_UNSIGNED_SHORT,
+  numpy.dtype(numpy.uint32): GL_UNSIGNED_INT,
+  numpy.dtype(numpy.float16): GL_HALF_FLOAT,
+  numpy.dtype(numpy.float32): GL_FLOAT,
+}
+_PIXEL_DTYPES = {v: k for k, v in _PIXEL_TYPES.items()}
+
+
+def pixel_format(array):
+  """
+  Returns the pixel format and type for uploading a NumPy *array* of shape
+  `(height, width)` or `(height, width, channels)` to a texture.
+  """
+
+  channels = array.shape[2] if array.ndim == 3 else 1
+  if array.ndim not in (2, 3) or channels not in _PIXEL_FORMATS:
+    raise ValueError('expected array of shape (height, width[, 1-4])')
+  try:
+    pixel_type = _PIXEL_TYPES[array.dtype]
+  except KeyError:
+    raise ValueError('unsupported dtype: {}'.format(array.dtype))
+  return _PIXEL_FORMATS[channels], pixel_type
+
+
+def _contiguous(array):
+  # Only copies if the array is not C-contiguous. PyOpenGL passes the data
+  # pointer of contiguous arrays to OpenGL directly.
+  return numpy.ascontiguousarray(array)
+
+
+class Buffer(_GLHandle):
+  """
+  A buffer object with *size* bytes of storage allocated for *target*. If
+  *data* is specified, it is uploaded as the initial content.
+  """
+
+  _binding_kind = 'buffer'
+
+  def __init__(self, size, usage=GL_STATIC_DRAW, target=GL_ARRAY_BUFFER, data=None):
+    self.size = size
+    self.usage = usage
+    self.target = target
+    self._handle = int(glGenBuffers(1))
+    if self._handle == 0:
+      raise GLError('glGenBuffers() failed')
+    self.bind()
+    glBufferData(target, size, data, usage)
+    self._unbind_pixel_buffer()
+
+  @classmethod
+  def from_array(cls, array, usage=GL_STATIC_DRAW, target=GL_ARRAY_BUFFER):
+    """
+    Creates a buffer with the contents of the NumPy *array*.
+    """
+
+    array = _contiguous(array)
+    return cls(array.nbytes, usage, target, array)
+
+  @classmethod
+  def pooled(cls, size, usage=GL_STATIC_DRAW, target=GL_ARRAY_BUFFER):
+    """
+    Like the constructor, but reuses a released buffer of the same size,
+    usage and target if there is one in the #ResourcePool.
+    """
+
+    key = (cls, size, usage, target)
+    return cls._get_pooled(key, lambda: cls(size, usage, target))
+
+  def bind(self, target=None):
+    current_state().bind_buffer(self.target if target is None else target, self)
+
+  def _unbind_pixel_buffer(self):
+    # A bound pixel buffer changes the meaning of the data pointer in pixel
+    # transfers, thus they are not left bound.
+    if self.target in (GL_PIXEL_PACK_BUFFER, GL_PIXEL_UNPACK_BUFFER):
+      current_state().bind_buffer(self.target, 0)
+
+  def write(self, array, offset=0):
+    """
+    Writes the NumPy *array* into the buffer at the byte *offset*.
+    """
+
+    array = _contiguous(array)
+    if offset < 0 or offset + array.nbytes > self.size:
+      raise ValueError('write exceeds buffer size')
+    self.bind()
+    glBufferSubData(self.target, offset, array.nbytes, array)
+    self._unbind_pixel_buffer()
+
+  def orphan(self):
+    """
+    Re-allocates the buffer storage without initializing it. Commands that
+    still read the old storage are not waited for.
+    """
+
+    self.bind()
+    glBufferData(self.target, self.size, None, self.usage)
+    self._unbind_pixel_buffer()
+
+  def read(self, dtype=numpy.uint8, offset=0, count=None):
+    """
+    Reads the buffer contents into a new NumPy array of the *dtype*.
+    """
+
+    dtype = numpy.dtype(dtype)
+    if count is None:
+      count = (self.size - offset) // dtype.itemsize
+    result = numpy.empty(count, dtype)
+    self.bind()
+    # PyOpenGL expects a byte array and would convert anything else.
+    glGetBufferSubData(self.target, offset, result.nbytes, result.view(numpy.uint8))
+    self._unbind_pixel_buffer()
+    return result
+
+  @staticmethod
+  def _delete_handles(handles):
+    glDeleteBuffers(len(handles), numpy.array(handles, numpy.uint32))
+
+
+class Texture(_GLHandle):
+  """
+  A 2D texture with storage for *width* x *height* texels of the
+  *internal_format*, which must be one of the #TEXTURE_FORMATS.
+
+  Arrays are exchanged in the shape `(height, width, channels)` with the
+  first row being the bottom row of the texture, as in OpenGL.
+  """
+
+  _binding_kind = 'texture'
+
+  def __init__(self, width, height, internal_format=GL_RGBA8):
+    if internal_format not in TEXTURE_FORMATS:
+      raise ValueError('unsupported internal format: {!r}'.format(internal_format))
+    self.width = width
+    self.height = height
+    self.internal_format = internal_format
+    self._handle = int(glGenTextures(1))
+    if self._handle == 0:
+      raise GLError('glGenTextures() failed')
+    pixel_format, pixel_type = TEXTURE_FORMATS[internal_format]
+    self.bind()
+    glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0,
+      pixel_format, pixel_type, None)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+    glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+
+  @classmethod
+  def from_array(cls, array, internal_format=None):
+    """
+    Creates a texture with the size and contents of the NumPy *array*. If
+    no *internal_format* is specified, it is derived from the array's
+    channels and dtype.
+    """
+
+    if internal_format is None:
+      formats = {v: k for k, v in TEXTURE_FORMATS.items()}
+      try:
+        internal_format = formats[pixel_format(array)]
+      except KeyError:
+        raise ValueError('no internal format for {} array with shape {}'
+          .format(array.dtype, array.shape))
+    texture = cls(array.shape[1], array.shape[0], internal_format)
+    texture.write(array)
+    return texture
+
+  @classmethod
+  def pooled(cls, width, height, internal_format=GL_RGBA8):
+    """
+    Like the constructor, but reuses a released texture of the same size
+    and format if there is one in the #ResourcePool.
+    """
+
+    key = (cls, width, height, internal_format)
+    return cls._get_pooled(key, lambda: cls(width, height, internal_format))
+
+  def bind(self, unit=0):
+    current_state().bind_texture(unit, GL_TEXTURE_2D, self)
+
+  def write(self, array, x=0, y=0, pixel_buffer=None):
+    """
+    Uploads the NumPy *array* into the region of the texture that starts
+    at *x*, *y*. If a *pixel_buffer* is specified, the data is read from
+    that buffer instead, with *array* only describing the format and size
+    of its content (see #TextureStream).
+    """
+
+    height, width = array.shape[:2]
+    if x < 0 or y < 0 or x + width > self.width or y + height > self.height:
+      raise ValueError('region exceeds texture size')
+    fmt, type_ = pixel_format(array)
+    state = current_state()
+    self.bind()
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    if pixel_buffer is not None:
+      state.bind_buffer(GL_PIXEL_UNPACK_BUFFER, pixel_buffer)
+      glTexSubImage2D(GL_TEXTURE_2D, 0, x, y, width, height, fmt, type_, None)
+      state.bind_buffer(GL_PIXEL_UNPACK_BUFFER, 0)
+    else:
+      state.bind_buffer(GL_PIXEL_UNPACK_BUFFER, 0)
+      glTexSubImage2D(GL_TEXTURE_2D, 0, x, y, width, height, fmt, type_, _contiguous(array))
+
+  def read(self, pixel_format=None, pixel_type=None):
+    """
+    Reads the texture into a new NumPy array. By default, the array has
+    the channels and type of the texture's #internal_format.
+    """
+
+    default_format, default_type = TEXTURE_FORMATS[self.internal_format]
+    pixel_format = pixel_format or default_format
+    pixel_type = pixel_type or default_type
+    channels = _PIXEL_CHANNELS[pixel_format]
+    result = numpy.empty((self.height, self.width, channels), _PIXEL_DTYPES[pixel_type])
+    current_state().bind_buffer(GL_PIXEL_PACK_BUFFER, 0)
+    self.bind()
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    glGetTexImage(GL_TEXTURE_2D, 0, pixel_format, pixel_type, result)
+    return result
+
+  @staticmethod
+  def _delete_handles(handles):
+    glDeleteTextures(numpy.array(handles, numpy.uint32))
+
+
+class TextureStream:
+  """
+  Streams arrays that change every frame into a #Texture through a ring of
+  pixel unpack buffers. #upload() copies the array into a mapped buffer and
+  starts an asynchronous transfer to the texture, thus the caller does not
+  wait for the driver to copy the data.
+
+  A fence is inserted after every transfer. Before a buffer is written to
+  again, #upload() waits for the fence of its previous transfer, so it
+  only blocks when the GPU is more than *count* uploads behind.
+
+  The buffers are created with the current #ResourceManager. Call
+  #release() to delete pending fences when the stream is no longer needed.
+  """
+
+  #: Nanoseconds to wait for a fence before checking again.
+  WAIT_TIMEOUT = 1000000000
+
+  def __init__(self, texture, count=2):
+    self.texture = texture
+    channels = _PIXEL_CHANNELS[TEXTURE_FORMATS[texture.internal_format][0]]
+    dtype = _PIXEL_DTYPES[TEXTURE_FORMATS[texture.internal_format][1]]
+    size = texture.width * texture.height * channels * dtype.itemsize
+    self.buffers = [Buffer.pooled(size, GL_STREAM_DRAW, GL_PIXEL_UNPACK_BUFFER)
+      for _ in range(count)]
+    self._fences = [None] * count
+    self._index = 0
+
+  def upload(self, array, x=0, y=0):
+    """
+    Uploads the NumPy *array* to the texture region at *x*, *y*.
+    """
+
+    array = _contiguous(array)
+    index = self._index
+    buffer = self.buffers[index]
+    if array.nbytes > buffer.size:
+      raise ValueError('array exceeds texture size')
+    self._index = (index + 1) % len(self.buffers)
+    self._wait(index)
+
+    # The fence guarantees that the buffer is no longer read, thus the
+    # driver does not need to synchronize the mapping.
+    current_state().bind_buffer(GL_PIXEL_UNPACK_BUFFER, buffer)
+    flags = GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT | GL_MAP_UNSYNCHRONIZED_BIT
+    address = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, array.nbytes, flags)
+    if not address:
+      raise GLError('glMapBufferRange() failed')
+    try:
+      mapped = (ctypes.c_ubyte * array.nbytes).from_address(address)
+      numpy.frombuffer(mapped, numpy.uint8)[:] = array.reshape(-1).view(numpy.uint8)
+    finally:
+      glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+    self.texture.write(array, x, y, pixel_buffer=buffer)
+    self._fences[index] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+  def _wait(self, index):
+    fence = self._fences[index]
+    if fence is None:
+      return
+    self._fences[index] = None
+    try:
+      while glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT,
+          self.WAIT_TIMEOUT) == GL_TIMEOUT_EXPIRED:
+        pass
+    finally:
+      glDeleteSync(fence)
 
   def release(self):
-    if self._handle != 0:
-      glDeleteProgram(self)
-      self._handle = 0
+    """
+    Deletes the pending fences. The buffers are released with their
+    #ResourceManager.
+    """
+
+    for index, fence in enumerate(self._fences):
+      if fence is not None:
+        glDeleteSync(fence)
+        self._fences[index] = None
+
+
+class Framebuffer(_GLHandle):
+  """
+  A framebuffer object. Use #attach() to attach textures.
+  """
+
+  _binding_kind = 'framebuffer'
+
+  def __init__(self):
+    self._handle = int(glGenFramebuffers(1))
+    if self._handle == 0:
+      raise GLError('glGenFramebuffers() failed')
+
+  @classmethod
+  def pooled(cls):
+    """
+    Like the constructor, but reuses a released framebuffer if there is
+    one in the #ResourcePool. Note that it may still have the attachments
+    of its previous use.
+    """
+
+    return cls._get_pooled((cls,), cls)
+
+  def bind(self, target=GL_FRAMEBUFFER):
+    current_state().bind_framebuffer(target, self)
+
+  def attach(self, texture, attachment=GL_COLOR_ATTACHMENT0):
+    """
+    Attaches the #Texture to the framebuffer, which must be bound.
+    """
+
+    glFramebufferTexture2D(GL_FRAMEBUFFER, attachment, GL_TEXTURE_2D, texture, 0)
+
+  @staticmethod
+  def _delete_handles(handles):
+    glDeleteFramebuffers(len(handles), numpy.array(handles, numpy.uint32))
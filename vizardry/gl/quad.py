@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""
+A fullscreen triangle that is shared by all users of the current OpenGL
+context. It is intended to be used with programs created with
+#Program.from_fragment(), which expects the vertex position at attribute
+location 0.
+"""
+
+__all__ = ['FullscreenQuad', 'draw_fullscreen_quad']
+
+from .api import *
+from .state import current_state
+from OpenGL import contextdata
+
+import numpy
+
+
+class FullscreenQuad:
+  """
+  Owns the vertex array and buffer for a single triangle that covers the
+  whole viewport. A triangle is used instead of two, as that avoids the
+  diagonal seam that would be shaded twice. Use #get() to retrieve the
+  instance for the current context.
+  """
+
+  VERTICES = numpy.array([-1.0, -1.0, 3.0, -1.0, -1.0, 3.0], dtype=numpy.float32)
+
+  def __init__(self):
+    self.vao = int(glGenVertexArrays(1))
+    self.vbo = int(glGenBuffers(1))
+    state = current_state()
+    state.bind_vertex_array(self.vao)
+    state.bind_buffer(GL_ARRAY_BUFFER, self.vbo)
+    glBufferData(GL_ARRAY_BUFFER, self.VERTICES.nbytes, self.VERTICES, GL_STATIC_DRAW)
+    glEnableVertexAttribArray(0)
+    glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 0, None)
+    state.bind_vertex_array(0)
+
+  @classmethod
+  def get(cls):
+    """
+    Returns the #FullscreenQuad of the current context, creating it if
+    it does not exist yet.
+    """
+
+    quad = contextdata.getValue(cls)
+    if quad is None:
+      quad = cls()
+      contextdata.setValue(cls, quad)
+    return quad
+
+  @classmethod
+  def release_current(cls):
+    """
+    Releases the #FullscreenQuad of the current context, if any.
+    """
+
+    quad = contextdata.getValue(cls)
+    if quad is not None:
+      contextdata.delValue(cls)
+      quad.release()
+
+  def draw(self):
+    """
+    Draws the triangle. The vertex array remains bound, which is known to
+    the #StateTracker so that consecutive draws skip the bind. Code that
+    sets up vertex attributes or element buffers with raw OpenGL calls
+    must bind its own vertex array first.
+    """
+
+    current_state().bind_vertex_array(self.vao)
+    glDrawArrays(GL_TRIANGLES, 0, 3)
+
+  def release(self):
+    if self.vao:
+      state = current_state(create=False)
+      if state is not None:
+        state.forget('vertex_array', [self.vao])
+        state.forget('buffer', [self.vbo])
+      glDeleteVertexArrays(1, [self.vao])
+      glDeleteBuffers(1, [self.vbo])
+      self.vao = self.vbo = 0
+
+
+def draw_fullscreen_quad():
+  """
+  Draws a triangle covering the whole viewport with the currently bound
+  program. Shorthand for `FullscreenQuad.get().draw()`.
+  """
+
+  FullscreenQuad.get().draw()
@@ -0,0 +1,263 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""
+A mock OpenGL backend that records the calls that Vizardry makes instead of
+executing them. It requires no OpenGL context, thus it can be used to test
+and profile the Python side of rendering on machines without a GPU.
+
+```python
+from vizardry import gl
+with gl.Recorder() as recorder:
+  with gl.ResourceManager().as_current():
+    program = gl.Program.from_fragment(source)
+assert recorder.count('glCompileShader') == 2
+```
+
+While a #Recorder is installed, the `gl*` functions in the namespaces of
+all #vizardry.gl modules (and the additional *modules* passed to the
+recorder) are replaced by recording functions, and a fake context is made
+current for #OpenGL.contextdata in the thread that installed the recorder.
+Code that imported OpenGL functions elsewhere is not affected.
+"""
+
+__all__ = ['Call', 'Recorder']
+
+from .api import *
+from .oop import ResourcePool
+from OpenGL import contextdata
+
+import collections
+import ctypes
+import itertools
+import numpy
+import sys
+import threading
+import time
+
+#: Handles returned by the recorder start at this value, thus they can be
+#: told apart from other integer arguments when the calls are replayed.
+HANDLE_BASE = 0x7f000000
+
+#: Functions that return new handles.
+HANDLE_FUNCTIONS = frozenset(['glCreateShader', 'glCreateProgram', 'glGenBuffers',
+  'glGenTextures', 'glGenFramebuffers', 'glGenVertexArrays', 'glGenRenderbuffers',
+  'glFenceSync'])
+
+Call = collections.namedtuple('Call', 'name args result time')
+
+
+class _RecordingFunction:
+
+  def __init__(self, recorder, name):
+    self.recorder = recorder
+    self.__name__ = name
+
+  def __repr__(self):
+    return '<recording {}>'.format(self.__name__)
+
+  def __call__(self, *args):
+    return self.recorder._record(self.__name__, args)
+
+
+def _freeze(arg):
+  # Arrays may be modified after the call, handle objects may be released.
+  if isinstance(arg, numpy.ndarray):
+    return arg.copy()
+  if hasattr(arg, '_handle'):
+    return int(arg._handle)
+  if isinstance(arg, (list, tuple)):
+    return type(arg)(_freeze(x) for x in arg)
+  return arg
+
+
+class Recorder:
+  """
+  Records OpenGL calls between #install() and #uninstall(), or while used
+  as a context manager. Every #Call has the function name, the arguments,
+  the result returned by the mock and the #time.perf_counter() at which the
+  call was made.
+
+  The results of functions are taken from the #returns dictionary, which
+  maps function names to functions that are called with the arguments. It
+  is pre-filled with functions that return new handles for the `glGen*()`
+  and `glCreate*()` functions and plausible values for the queries that
+  Vizardry makes; everything else returns #None.
+  """
+
+  def __init__(self, modules=()):
+    self.modules = list(modules)
+    self.calls = []
+    self.returns = {}
+    self._handles = itertools.count(HANDLE_BASE + 1)
+    self._mapped = {}
+    self._saved = None
+    self._saved_get_context = None
+    self._setup_returns()
+
+  def __enter__(self):
+    self.install()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.uninstall()
+
+  def _setup_returns(self):
+    new_handle = lambda *args: next(self._handles)
+    for name in HANDLE_FUNCTIONS:
+      self.returns[name] = new_handle
+
+    def get_programiv(program, pname):
+      return 1 if pname in (GL_LINK_STATUS, GL_VALIDATE_STATUS) else 0
+    def get_shaderiv(shader, pname):
+      return 1 if pname == GL_COMPILE_STATUS else 0
+    def get_integerv(pname):
+      return numpy.zeros(4, numpy.int32) if pname == GL_VIEWPORT else 0
+    def map_buffer_range(target, offset, length, access):
+      memory = ctypes.create_string_buffer(int(length))
+      self._mapped[target] = memory
+      return ctypes.addressof(memory)
+    def unmap_buffer(target):
+      self._mapped.pop(target, None)
+      return True
+
+    self.returns.update({
+      'glGetProgramiv': get_programiv,
+      'glGetShaderiv': get_shaderiv,
+      'glGetIntegerv': get_integerv,
+      'glGetProgramInfoLog': lambda program: b'',
+      'glGetShaderInfoLog': lambda shader: b'',
+      'glGetString': lambda name: b'vizardry.gl.recorder',
+      'glGetUniformLocation': lambda program, name: -1,
+      'glGetError': lambda: GL_NO_ERROR,
+      'glCheckFramebufferStatus': lambda target: GL_FRAMEBUFFER_COMPLETE,
+      'glClientWaitSync': lambda sync, flags, timeout: GL_ALREADY_SIGNALED,
+      'glMapBufferRange': map_buffer_range,
+      'glUnmapBuffer': unmap_buffer,
+    })
+
+  def _record(self, name, args):
+    now = time.perf_counter()
+    func = self.returns.get(name)
+    result = func(*args) if func else None
+    self.calls.append(Call(name, tuple(_freeze(x) for x in args), result, now))
+    return result
+
+  def _namespaces(self):
+    modules = [m for k, m in sorted(sys.modules.items())
+      if m is not None and (k == 'vizardry.gl' or k.startswith('vizardry.gl.'))]
+    return modules + [m for m in self.modules if m not in modules]
+
+  def install(self):
+    """
+    Replaces the OpenGL functions with recording functions.
+    """
+
+    if self._saved is not None:
+      raise RuntimeError('Recorder is already installed')
+    self._saved = []
+    functions = {}
+    for module in self._namespaces():
+      for name, value in vars(module).items():
+        if name.startswith('gl') and callable(value):
+          if name not in functions:
+            functions[name] = _RecordingFunction(self, name)
+          self._saved.append((module, name, value))
+          setattr(module, name, functions[name])
+
+    # The fake context is only current in the thread that installed the
+    # recorder, like a real context.
+    get_context = self._saved_get_context = contextdata.getContext
+    thread = threading.get_ident()
+    def get_fake_context(context=None):
+      if context or threading.get_ident() != thread:
+        return get_context(context)
+      return id(self)
+    contextdata.getContext = get_fake_context
+
+  def uninstall(self):
+    """
+    Restores the original OpenGL functions. Handles that are still in the
+    #ResourcePool of the fake context are deleted first.
+    """
+
+    if self._saved is None:
+      return
+    pool = ResourcePool.current()
+    if pool is not None:
+      pool.clear()
+    context = contextdata.getContext()
+    contextdata.getContext = self._saved_get_context
+    contextdata.cleanupContext(context)
+    for module, name, value in reversed(self._saved):
+      setattr(module, name, value)
+    self._saved = None
+
+  def clear(self):
+    del self.calls[:]
+
+  def count(self, name):
+    """
+    Returns the number of recorded calls to the function *name*.
+    """
+
+    return sum(1 for call in self.calls if call.name == name)
+
+  def names(self):
+    """
+    Returns the names of the recorded calls in order.
+    """
+
+    return [call.name for call in self.calls]
+
+  def summary(self):
+    """
+    Returns a #collections.Counter of the recorded function names.
+    """
+
+    return collections.Counter(call.name for call in self.calls)
+
+  def replay(self, gl_module=None):
+    """
+    Executes the recorded calls against the functions of *gl_module*
+    (defaults to #OpenGL.GL), which requires a current OpenGL context.
+    Handles that were returned by the recorder are translated to the
+    handles returned during the replay.
+    """
+
+    if gl_module is None:
+      import OpenGL.GL as gl_module
+
+    handles = {}
+    def translate(arg):
+      if isinstance(arg, int) and arg in handles:
+        return handles[arg]
+      if isinstance(arg, (list, tuple)):
+        return type(arg)(translate(x) for x in arg)
+      if isinstance(arg, numpy.ndarray) and arg.dtype.kind in 'iu':
+        return numpy.array([translate(int(x)) for x in arg.ravel()], arg.dtype).reshape(arg.shape)
+      return arg
+
+    for call in self.calls:
+      result = getattr(gl_module, call.name)(*map(translate, call.args))
+      if call.name in HANDLE_FUNCTIONS:
+        handles[call.result] = result
@@ -0,0 +1,398 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""
+Instead of drawing immediately in #GLObjectInterface.gl_render(), nodes
+can submit draw items to the #RenderQueue of the current context. The
+queue is flushed by #Scene.gl_render() after all nodes have been rendered.
+It sorts the items to minimize the state changes between them and merges
+items that only differ in their per-instance data into one instanced draw.
+
+```python
+geometry = gl.Geometry.fullscreen(instance_location=1)
+gl.submit(program, geometry, uniforms={'time': t}, instance=(x, y))
+```
+"""
+
+__all__ = ['Geometry', 'RenderState', 'DrawItem', 'RenderQueue', 'submit']
+
+from .api import *
+from .quad import FullscreenQuad
+from .state import current_state
+from OpenGL import contextdata
+
+import collections
+import contextlib
+import ctypes
+import numpy
+
+
+class Geometry(collections.namedtuple('Geometry', 'vertex_array count mode first instance_location')):
+  """
+  Describes the vertices of a draw item: the *count* vertices starting at
+  *first* of the *vertex_array* object, assembled as primitives of the
+  *mode*. If *instance_location* is specified, items that use the geometry
+  can be merged into an instanced draw which passes the per-instance data
+  in a `vec4` attribute at that location.
+  """
+
+  def __new__(cls, vertex_array, count, mode=GL_TRIANGLES, first=0, instance_location=None):
+    return super().__new__(cls, int(vertex_array), count, mode, first, instance_location)
+
+  @classmethod
+  def fullscreen(cls, instance_location=None):
+    """
+    Returns the geometry of the #FullscreenQuad of the current context.
+    """
+
+    return cls(FullscreenQuad.get().vao, 3, instance_location=instance_location)
+
+
+class RenderState(collections.namedtuple('RenderState', 'blend depth_test depth_write')):
+  """
+  The fixed-function state of a draw item.
+
+  # Parameters
+  blend (tuple): The source and destination factors for #glBlendFunc(), or
+    #None to disable blending.
+  depth_test (int): The comparison function for the depth test, or #None
+    to disable it.
+  depth_write (bool): Whether the draw writes to the depth buffer.
+  """
+
+  def __new__(cls, blend=None, depth_test=None, depth_write=True):
+    return super().__new__(cls, tuple(blend) if blend else None, depth_test, bool(depth_write))
+
+  def apply(self, state):
+    """
+    Applies the render state through the #StateTracker *state*.
+    """
+
+    if self.blend:
+      state.enable(GL_BLEND)
+      state.blend_func(*self.blend)
+    else:
+      state.disable(GL_BLEND)
+    if self.depth_test is not None:
+      state.enable(GL_DEPTH_TEST)
+      state.depth_func(self.depth_test)
+    else:
+      state.disable(GL_DEPTH_TEST)
+    state.depth_mask(self.depth_write)
+
+
+RenderState.DEFAULT = RenderState()
+RenderState.ALPHA_BLEND = RenderState(blend=(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA))
+
+
+def _uniform_value(value):
+  if isinstance(value, (bool, int, numpy.integer)):
+    return int(value)
+  if isinstance(value, (float, numpy.floating)):
+    return float(value)
+  value = tuple(float(x) for x in numpy.asarray(value, dtype=numpy.float32).ravel())
+  if len(value) not in (2, 3, 4, 16):
+    raise ValueError('unsupported uniform value with {} components'.format(len(value)))
+  return value
+
+
+def _set_uniform(program, name, value):
+  if isinstance(value, int):
+    program.set_int(name, value)
+  elif isinstance(value, float):
+    program.set_float(name, value)
+  elif len(value) == 2:
+    program.set_vec2(name, *value)
+  elif len(value) == 3:
+    program.set_vec3(name, *value)
+  elif len(value) == 4:
+    program.set_vec4(name, *value)
+  else:
+    program.set_mat4(name, value)
+
+
+class DrawItem:
+  """
+  A draw of the *geometry* with the *program*. Use #RenderQueue.submit()
+  to create draw items.
+
+  # Parameters
+  program (Program): The program to draw with.
+  geometry (Geometry): The vertices to draw.
+  state (RenderState): The fixed-function state for the draw.
+  uniforms (dict): Maps uniform names to values. Integers and floats are
+    uploaded as `int` and `float`, sequences of 2, 3, 4 or 16 numbers as
+    vectors and 4x4 matrices (row-major).
+  textures (list of Texture): Textures to bind to the texture units in
+    the order of the list.
+  instance (tuple): Up to four numbers that are passed to the program in
+    the instance attribute of the *geometry*. Missing components default
+    to `(0, 0, 0, 1)`.
+  layer (int): Items in lower layers are drawn first. Within a layer, the
+    queue may reorder the items.
+  """
+
+  __slots__ = ('program', 'geometry', 'state', 'uniforms', 'textures',
+    'instance', 'layer')
+
+  def __init__(self, program, geometry, state=None, uniforms=None,
+               textures=(), instance=None, layer=0):
+    self.program = program
+    self.geometry = geometry
+    self.state = state or RenderState.DEFAULT
+    self.uniforms = tuple(sorted((k, _uniform_value(v)) for k, v in (uniforms or {}).items()))
+    self.textures = tuple(textures)
+    if instance is not None:
+      instance = tuple(float(x) for x in instance)
+      if len(instance) > 4:
+        raise ValueError('instance data has more than 4 components')
+      instance += (0.0, 0.0, 0.0, 1.0)[len(instance):]
+    self.instance = instance
+    self.layer = layer
+
+  def __repr__(self):
+    return '<DrawItem program={!r} geometry={!r} layer={!r}>'.format(
+      self.program, self.geometry, self.layer)
+
+  def batch_key(self):
+    """
+    Items with an equal batch key only differ in their #instance data.
+    """
+
+    return (self.layer, int(self.program), self.state,
+      tuple(int(x) for x in self.textures), self.geometry, self.uniforms)
+
+
+class RenderQueue:
+  """
+  Collects the #DrawItem#s of a frame for the current OpenGL context. Use
+  #current() to get the queue of the current context.
+
+  The per-instance data of all instanced draws is uploaded in one buffer
+  that the queue owns. Instance attributes are disabled again after the
+  queue is flushed, so that the geometry can still be drawn directly.
+
+  # Members
+  submitted (int): The number of items that were submitted.
+  draws (int): The number of draw calls that were issued for them.
+  """
+
+  def __init__(self):
+    self._items = []
+    self._buffer = 0
+    self._buffer_size = 0
+    self.submitted = 0
+    self.draws = 0
+
+  def __len__(self):
+    return len(self._items)
+
+  def __repr__(self):
+    return '<RenderQueue submitted={} draws={}>'.format(self.submitted, self.draws)
+
+  @classmethod
+  def current(cls):
+    """
+    Returns the #RenderQueue of the current context, creating it if it does
+    not exist yet.
+    """
+
+    queue = contextdata.getValue(cls)
+    if queue is None:
+      queue = cls()
+      contextdata.setValue(cls, queue)
+    return queue
+
+  @classmethod
+  def release_current(cls):
+    """
+    Releases the #RenderQueue of the current context, if any.
+    """
+
+    queue = contextdata.getValue(cls)
+    if queue is not None:
+      contextdata.delValue(cls)
+      queue.release()
+
+  def reset_counters(self):
+    self.submitted = 0
+    self.draws = 0
+
+  def submit(self, program, geometry, **kwargs):
+    """
+    Creates a #DrawItem and adds it to the queue. Accepts the same
+    arguments as the #DrawItem constructor.
+    """
+
+    item = DrawItem(program, geometry, **kwargs)
+    self._items.append(item)
+    self.submitted += 1
+    return item
+
+  def clear(self):
+    """
+    Drops all items without drawing them.
+    """
+
+    del self._items[:]
+
+  @contextlib.contextmanager
+  def section(self):
+    """
+    Items that are submitted inside the block are drawn when the block
+    exits, eg. into a #RenderTarget that is bound in the block. The items
+    that were queued before are kept for the next #flush().
+    """
+
+    items, self._items = self._items, []
+    try:
+      yield self
+      self.flush()
+    finally:
+      self._items = items
+
+  def batches(self):
+    """
+    Sorts the queued items and returns a list of batches. Every batch is a
+    list of items that can be drawn with a single draw call. The queue is
+    not changed.
+    """
+
+    # Map the keys to integers in the order they are first seen, as the
+    # keys can not be compared with each other.
+    indices = {}
+    def index(value):
+      return indices.setdefault(value, len(indices))
+    def sort_key(item):
+      return (item.layer, int(item.program), index(item.state),
+        index(tuple(int(x) for x in item.textures)), item.geometry.vertex_array,
+        index(item.geometry), index(item.uniforms), item.instance is None)
+
+    batches = []
+    batch_key = None
+    for item in sorted(self._items, key=sort_key):
+      key = item.batch_key()
+      if (batches and key == batch_key and item.instance is not None
+          and batches[-1][0].instance is not None
+          and item.geometry.instance_location is not None):
+        batches[-1].append(item)
+      else:
+        batches.append([item])
+        batch_key = key
+    return batches
+
+  def flush(self):
+    """
+    Draws and removes all queued items. Returns the number of draw calls.
+    """
+
+    batches = self.batches()
+    self.clear()
+    if not batches:
+      return 0
+
+    state = current_state()
+    offsets = self._upload_instances(batches)
+    enabled = set()
+    try:
+      for batch, offset in zip(batches, offsets):
+        item = batch[0]
+        item.program.use()
+        for name, value in item.uniforms:
+          _set_uniform(item.program, name, value)
+        for unit, texture in enumerate(item.textures):
+          texture.bind(unit)
+        item.state.apply(state)
+        self._draw(state, item.geometry, offset, len(batch), enabled)
+    finally:
+      for vertex_array, location in enabled:
+        state.bind_vertex_array(vertex_array)
+        glDisableVertexAttribArray(location)
+    self.draws += len(batches)
+    return len(batches)
+
+  def _upload_instances(self, batches):
+    """
+    Uploads the instance data of all batches into the instance buffer and
+    returns the byte offset of every batch's data, or #None for batches
+    that are not drawn instanced.
+    """
+
+    offsets = []
+    data = []
+    for batch in batches:
+      if batch[0].instance is None or batch[0].geometry.instance_location is None:
+        offsets.append(None)
+        continue
+      offsets.append(len(data) * 16)
+      data.extend(item.instance for item in batch)
+    if not data:
+      return offsets
+
+    data = numpy.array(data, dtype=numpy.float32)
+    state = current_state()
+    if not self._buffer:
+      self._buffer = int(glGenBuffers(1))
+    state.bind_buffer(GL_ARRAY_BUFFER, self._buffer)
+    if data.nbytes > self._buffer_size:
+      self._buffer_size = max(data.nbytes, self._buffer_size * 2)
+    # Orphan the storage so that draws of the previous frame that still
+    # read from it are not waited for.
+    glBufferData(GL_ARRAY_BUFFER, self._buffer_size, None, GL_STREAM_DRAW)
+    glBufferSubData(GL_ARRAY_BUFFER, 0, data.nbytes, data)
+    return offsets
+
+  def _draw(self, state, geometry, offset, count, enabled):
+    state.bind_vertex_array(geometry.vertex_array)
+    location = geometry.instance_location
+    if offset is None:
+      if (geometry.vertex_array, location) in enabled:
+        glDisableVertexAttribArray(location)
+        enabled.discard((geometry.vertex_array, location))
+      glDrawArrays(geometry.mode, geometry.first, geometry.count)
+      return
+    state.bind_buffer(GL_ARRAY_BUFFER, self._buffer)
+    if (geometry.vertex_array, location) not in enabled:
+      glEnableVertexAttribArray(location)
+      glVertexAttribDivisor(location, 1)
+      enabled.add((geometry.vertex_array, location))
+    glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, 0, ctypes.c_void_p(offset))
+    glDrawArraysInstanced(geometry.mode, geometry.first, geometry.count, count)
+
+  def release(self):
+    self.clear()
+    if self._buffer:
+      state = current_state(create=False)
+      if state is not None:
+        state.forget('buffer', [self._buffer])
+      glDeleteBuffers(1, [self._buffer])
+      self._buffer = 0
+      self._buffer_size = 0
+
+
+def submit(program, geometry, **kwargs):
+  """
+  Submits a #DrawItem to the #RenderQueue of the current context.
+  Shorthand for `RenderQueue.current().submit(...)`.
+  """
+
+  return RenderQueue.current().submit(program, geometry, **kwargs)
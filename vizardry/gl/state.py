@@ -0,0 +1,201 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""
+Shadows a subset of the OpenGL state to drop calls that would not change
+it. Every call through PyOpenGL is expensive, and nodes that render one
+after another usually bind the same objects again.
+
+The tracker only knows about changes that are made through it. Code that
+changes the same state with the raw OpenGL functions must call
+#StateTracker.invalidate() afterwards.
+"""
+
+__all__ = ['StateTracker', 'current_state']
+
+from .api import *
+from OpenGL import contextdata, error as gl_error
+
+
+class StateTracker:
+  """
+  Tracks the current program, the vertex array, buffer, texture and
+  framebuffer bindings, enabled capabilities and the blend and depth state
+  of a single OpenGL context. Use #current_state() to get the tracker of
+  the current context.
+
+  # Members
+  issued (int): The number of calls that were passed to OpenGL.
+  skipped (int): The number of calls that were dropped because they would
+    not have changed the state.
+  """
+
+  def __init__(self):
+    self._shadow = {}
+    self.issued = 0
+    self.skipped = 0
+
+  def __repr__(self):
+    return '<StateTracker issued={} skipped={}>'.format(self.issued, self.skipped)
+
+  def _set(self, key, value, func, *args):
+    if key in self._shadow and self._shadow[key] == value:
+      self.skipped += 1
+      return False
+    func(*args)
+    self._shadow[key] = value
+    self.issued += 1
+    return True
+
+  def invalidate(self):
+    """
+    Forget the shadowed state. The next call for every state is passed to
+    OpenGL again.
+    """
+
+    self._shadow.clear()
+
+  def reset_counters(self):
+    self.issued = 0
+    self.skipped = 0
+
+  def forget(self, kind, handles):
+    """
+    Called when the *handles* of a *kind* of object (`'buffer'`,
+    `'texture'`, `'framebuffer'` or `'vertex_array'`) are deleted. OpenGL
+    reverts bindings of deleted objects to zero, and the handle values may be
+    reused by new objects.
+    """
+
+    handles = set(int(x) for x in handles)
+    for key, value in list(self._shadow.items()):
+      if key[0] == 'element_buffer':
+        if kind == 'buffer' and value in handles:
+          self._shadow[key] = 0
+        elif kind == 'vertex_array' and key[1] in handles:
+          # A new vertex array with the same name starts without a binding.
+          del self._shadow[key]
+      elif key[0] == kind and value in handles:
+        self._shadow[key] = 0
+
+  def use_program(self, program):
+    program = int(program or 0)
+    return self._set(('program',), program, glUseProgram, program)
+
+  def bind_vertex_array(self, vao):
+    vao = int(vao or 0)
+    return self._set(('vertex_array',), vao, glBindVertexArray, vao)
+
+  def bind_buffer(self, target, buffer):
+    """
+    Binds the *buffer* to the *target*. The #GL_ELEMENT_ARRAY_BUFFER binding
+    is part of the bound vertex array, thus it is shadowed per vertex array,
+    and not at all while the vertex array is unknown.
+    """
+
+    buffer = int(buffer or 0)
+    if target == GL_ELEMENT_ARRAY_BUFFER:
+      vao = self._shadow.get(('vertex_array',))
+      if vao is None:
+        glBindBuffer(target, buffer)
+        self.issued += 1
+        return True
+      key = ('element_buffer', vao)
+    else:
+      key = ('buffer', target)
+    return self._set(key, buffer, glBindBuffer, target, buffer)
+
+  def active_texture(self, unit):
+    """
+    Selects the active texture unit. *unit* is the unit index, not the
+    `GL_TEXTURE0 + index` constant.
+    """
+
+    return self._set(('active_texture',), unit, glActiveTexture, GL_TEXTURE0 + unit)
+
+  def bind_texture(self, unit, target, texture):
+    """
+    Binds the *texture* to the *target* of the texture *unit*. Only selects
+    the unit if the binding actually changes.
+    """
+
+    texture = int(texture or 0)
+    key = ('texture', unit, target)
+    if key in self._shadow and self._shadow[key] == texture:
+      self.skipped += 1
+      return False
+    self.active_texture(unit)
+    return self._set(key, texture, glBindTexture, target, texture)
+
+  def bind_framebuffer(self, target, framebuffer):
+    """
+    Binds the *framebuffer*. #GL_FRAMEBUFFER binds it to both the draw and
+    the read target.
+    """
+
+    framebuffer = int(framebuffer or 0)
+    if target == GL_FRAMEBUFFER:
+      keys = [('framebuffer', GL_DRAW_FRAMEBUFFER), ('framebuffer', GL_READ_FRAMEBUFFER)]
+      if all(self._shadow.get(k) == framebuffer for k in keys):
+        self.skipped += 1
+        return False
+      glBindFramebuffer(target, framebuffer)
+      self.issued += 1
+      for key in keys:
+        self._shadow[key] = framebuffer
+      return True
+    return self._set(('framebuffer', target), framebuffer, glBindFramebuffer, target, framebuffer)
+
+  def enable(self, cap):
+    return self._set(('cap', cap), True, glEnable, cap)
+
+  def disable(self, cap):
+    return self._set(('cap', cap), False, glDisable, cap)
+
+  def blend_func(self, sfactor, dfactor):
+    return self._set(('blend_func',), (sfactor, dfactor), glBlendFunc, sfactor, dfactor)
+
+  def depth_func(self, func):
+    return self._set(('depth_func',), func, glDepthFunc, func)
+
+  def depth_mask(self, flag):
+    flag = bool(flag)
+    return self._set(('depth_mask',), flag, glDepthMask, flag)
+
+
+def current_state(create=True):
+  """
+  Returns the #StateTracker of the current OpenGL context. If *create* is
+  #False and the context has no tracker yet, or no context is current,
+  #None is returned.
+  """
+
+  try:
+    state = contextdata.getValue(StateTracker)
+  except gl_error.Error:
+    if create:
+      raise
+    return None
+  if state is None and create:
+    state = StateTracker()
+    contextdata.setValue(StateTracker, state)
+  return state
@@ -22,18 +22,28 @@
 import argparse
 import vizardry
 import sys
-import wx
-from vizardry.main.mainwindow import MainWindow
 
 
 def get_argument_parser(prog):
-  parser = argparse.ArgumentParser(prog=prog, description=vizardry.__doc__)
+  parser = argparse.ArgumentParser(prog=prog, description=vizardry.__doc__,
+    epilog='Use "%(prog)s render --help" for rendering without a window.')
   return parser
 
 
 def main(argv=None, prog=None):
+  if argv is None:
+    argv = sys.argv[1:]
+  if argv[:1] == ['render']:
+    # Renders headless, thus must not import wx.
+    from vizardry.render import main as render_main
+    prog = (prog or 'vizardry') + ' render'
+    return render_main(argv[1:], prog)
+
   parser = get_argument_parser(prog)
-  args = parser.parse_args()
+  args = parser.parse_args(argv)
+
+  import wx
+  from vizardry.main.mainwindow import MainWindow
   app = wx.App()
   window = MainWindow('Vizardry')
   window.Show()
@@ -19,13 +19,27 @@
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
 # IN THE SOFTWARE.
 
-import textwrap
 import traceback
 import wx
+from vizardry.behaviours.defaults import add_default_nodes
+from vizardry.core.generics.lrucache import LRUCache
 from vizardry.core.interfaces import NodeBehaviour
 from vizardry.core.scene import Scene, get_node_factories
+from vizardry.main.parameters import create_panel
 from vizardry.main.viewport import Viewport
 
+_icons = {}
+
+
+def load_icon(filename):
+  """
+  Loads an image file as #wx.Image. Images are cached by filename.
+  """
+
+  if filename not in _icons:
+    _icons[filename] = wx.Image(filename)
+  return _icons[filename]
+
 
 class ParameterPanel(wx.Panel):
 
@@ -34,6 +48,8 @@ class ParameterPanel(wx.Panel):
     self.node = node
 
     icon = node.behaviour.node_icon()
+    if isinstance(icon, str):
+      icon = load_icon(icon)
     if isinstance(icon, wx.Image):
       icon = icon.Scale(24, 24).ConvertToBitmap()
 
@@ -46,18 +62,30 @@ class ParameterPanel(wx.Panel):
     self.node_name.Bind(wx.EVT_TEXT_ENTER, self.__on_name_changed)
     self.node_name.Bind(wx.EVT_KILL_FOCUS, self.__on_name_kill_focus)
     sizer = wx.BoxSizer(wx.HORIZONTAL)
+    self.node_path = wx.StaticText(self.path_panel)
     sizer.Add(self.node_icon)
-    sizer.Add(wx.StaticText(self.path_panel, label=(node.parent.path if node.parent else '/')))
+    sizer.Add(self.node_path)
     sizer.Add(self.node_name)
     self.path_panel.SetSizer(sizer)
 
-    self.node_params = node.params.create_panel(self)
+    self.param_names = tuple(param.name for param in node.params)
+    self.node_params = create_panel(node.params, self)
 
     sizer = wx.BoxSizer(wx.VERTICAL)
     sizer.Add(self.path_panel)
     if self.node_params:
       sizer.Add(self.node_params, 1, wx.EXPAND)
     self.SetSizer(sizer)
+    self.refresh()
+
+  def refresh(self):
+    """
+    Update the displayed node name and path, eg. when the panel is reused.
+    """
+
+    self.node_path.SetLabel(self.node.parent.path if self.node.parent else '/')
+    self.node_name.SetValue(self.node.name)
+    self.path_panel.Layout()
 
   def __on_name_changed(self, ev):
     try:
@@ -90,9 +118,13 @@ class NodelistPanel(wx.Panel):
 
     self.refresh()
 
-    func = lambda ev: self.refresh()
-    self.scene.root.bind(self.scene.root.EV_NAME_CHANGED, func, global_=True)
-    self.scene.root.bind(self.scene.root.EV_PARENT_CHANGED, func, global_=True)
+    # Weak listeners, so the scene does not keep a closed panel alive.
+    root = self.scene.root
+    root.bind(root.EV_NAME_CHANGED, self.__node_changed, global_=True, weak=True)
+    root.bind(root.EV_PARENT_CHANGED, self.__node_changed, global_=True, weak=True)
+
+  def __node_changed(self, ev):
+    self.refresh()
 
   def __rightclick(self, ev):
     index = self.listbox.HitTest(ev.GetPosition())
@@ -138,6 +170,14 @@ class NodelistPanel(wx.Panel):
 
 
 class EditorPane(wx.Panel):
+  """
+  Shows the list of nodes and the parameters of the active node. The
+  #ParameterPanel#s of the most recently edited nodes are kept alive and
+  reused, the least recently used panel is destroyed once there are more
+  than #PANEL_CACHE_SIZE panels.
+  """
+
+  PANEL_CACHE_SIZE = 8
 
   def __init__(self, parent, scene):
     super().__init__(parent, -1)
@@ -152,6 +192,8 @@ class EditorPane(wx.Panel):
     self.notebook.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.__page_changed)
 
     self.parameter_panel = None
+    self.parameter_panels = LRUCache(self.PANEL_CACHE_SIZE, self.__destroy_panel)
+    self.edit_page.SetSizer(wx.BoxSizer(wx.VERTICAL))
 
     sizer = wx.BoxSizer(wx.HORIZONTAL)
     sizer.Add(self.notebook, 1, wx.EXPAND)
@@ -159,7 +201,30 @@ class EditorPane(wx.Panel):
 
     self.update()
 
-    self.scene.bind(self.scene.EV_FOCUS_PARAMETERS, lambda ev: self.notebook.SetSelection(1))
+    self.__focus_listener = self.scene.bind(self.scene.EV_FOCUS_PARAMETERS,
+      self.__focus_parameters, weak=True)
+    self.__removed_listener = self.scene.bind(self.scene.EV_NODE_REMOVED,
+      self.__node_removed, weak=True)
+    self.Bind(wx.EVT_WINDOW_DESTROY, self.__destroy)
+
+  def __destroy(self, ev):
+    if ev.GetEventObject() is self:
+      self.scene.unbind(self.scene.EV_FOCUS_PARAMETERS, self.__focus_listener, missing_ok=True)
+      self.scene.unbind(self.scene.EV_NODE_REMOVED, self.__removed_listener, missing_ok=True)
+    ev.Skip()
+
+  def __node_removed(self, ev):
+    # Destroy the panels of the removed nodes, so that the nodes are not
+    # kept alive by the cache.
+    for node in ev.data['node'].iter_hierarchy():
+      panel = self.parameter_panels.get(node)
+      if panel is not None and panel is self.parameter_panel:
+        self.parameter_panel = None
+      self.parameter_panels.evict(node)
+    self.edit_page.Layout()
+
+  def __focus_parameters(self, ev):
+    self.notebook.SetSelection(1)
 
   def __page_changed(self, ev):
     if self.notebook.GetSelection() == 1:
@@ -167,14 +232,29 @@ class EditorPane(wx.Panel):
 
   def update(self):
     if self.parameter_panel:
-      self.parameter_panel.Destroy()
+      self.parameter_panel.Hide()
       self.parameter_panel = None
-    if self.scene.active_node:
-      self.parameter_panel = ParameterPanel(self.edit_page, self.scene.active_node)
-      sizer = wx.BoxSizer(wx.VERTICAL)
-      sizer.Add(self.parameter_panel, 1, wx.EXPAND)
-      self.edit_page.SetSizer(sizer)
-      self.edit_page.SendSizeEvent()
+    node = self.scene.active_node
+    if node:
+      panel = self.parameter_panels.get(node)
+      param_names = tuple(param.name for param in node.params)
+      if panel is not None and panel.param_names != param_names:
+        self.parameter_panels.evict(node)
+        panel = None
+      if panel is None:
+        panel = ParameterPanel(self.edit_page, node)
+        self.edit_page.GetSizer().Add(panel, 1, wx.EXPAND)
+      else:
+        panel.refresh()
+        panel.Show()
+      self.parameter_panel = panel
+      self.parameter_panels.put(node, panel)
+    self.edit_page.Layout()
+    self.edit_page.SendSizeEvent()
+
+  def __destroy_panel(self, panel):
+    self.edit_page.GetSizer().Detach(panel)
+    panel.Destroy()
 
 
 class MainWindow(wx.Frame):
@@ -192,7 +272,10 @@ class MainWindow(wx.Frame):
     self.settings_pane = EditorPane(self, scene)
 
     self.scene = scene or Scene()
-    self.scene.bind(self.scene.EV_VIEWPORT_UPDATE, self.__viewport_update)
+    self.scene.queued = True
+    self.scene.event_queue.notify = wx.WakeUpIdle
+    self.__viewport_listener = self.scene.bind(self.scene.EV_VIEWPORT_UPDATE,
+      self.__viewport_update, weak=True)
 
     sizer = wx.BoxSizer(wx.HORIZONTAL)
     sizer.Add(self.viewport, 4, wx.EXPAND)
@@ -201,6 +284,7 @@ class MainWindow(wx.Frame):
 
     self.SetClientSize(1024, 512)
     self.Bind(wx.EVT_CLOSE, self.__close)
+    self.Bind(wx.EVT_IDLE, self.__idle)
 
     #self.timer = wx.Timer(self, 1)
     #self.Bind(wx.EVT_TIMER, self._timer, self.timer)
@@ -208,7 +292,16 @@ class MainWindow(wx.Frame):
   def __viewport_update(self, ev):
     self.viewport.canvas.Refresh(False)
 
+  def __idle(self, ev):
+    # Dispatch the events collected since the last iteration of the event
+    # loop, eg. only one viewport refresh for a burst of updates.
+    self.scene.flush_events()
+    if len(self.scene.event_queue) > 0:
+      ev.RequestMore()
+    ev.Skip()
+
   def __close(self, ev):
+    self.scene.unbind(self.scene.EV_VIEWPORT_UPDATE, self.__viewport_listener, missing_ok=True)
     self.scene.gl_cleanup()
     ev.Skip()
 
@@ -228,65 +321,3 @@ class MainWindow(wx.Frame):
   def update(self):
     self._update_timer()
     self.viewport.canvas.Refresh(False)
-
-
-def add_default_nodes(scene):
-  from vizardry.behaviours.glinline import GLInline
-  from vizardry.behaviours.resource import Resource
-
-  glinline = GLInline(scene)
-  glinline.params['code'] = textwrap.dedent('''
-    from vizardry import gl
-    from vizardry.gl.api import *
-
-    program = None
-
-    def gl_render():
-      global program
-      if not program:
-        code = node.find_node('../fragment').params['text']
-        program = gl.Program.from_fragment(code)
-      glUseProgram(program)
-      glUniform1f(glGetUniformLocation(program, 'time'), node.scene.time)
-      glBegin(GL_TRIANGLE_STRIP)
-      glVertex2f(-1.0, -1.0)
-      glVertex2f(1.0, -1.0)
-      glVertex2f(-1.0, 1.0)
-      glVertex2f(1.0, 1.0)
-      glEnd()
-    ''').lstrip()
-  glinline.attach_to(scene.root)
-
-  fragment = Resource(scene, 'fragment')
-  fragment.params['text'] = textwrap.dedent('''
-    #version 330 core
-    uniform float time;
-    in vec2 fragCoord;
-    out vec4 fragColor;
-    const int ncolors = 5;
-    const vec3 colors[ncolors] = vec3[](
-      vec3(0.1, 0.3, 1.0),
-      vec3(0.1, 0.3, 1.0),
-      vec3(0.7, 0.9, 0.8),
-      vec3(1.0, 1.0, 1.0),
-      vec3(0.7, 0.2, 0.2)
-    );
-    void main() {
-      vec2 c = fragCoord.xy;
-      c = c * vec2(4,3) - vec2(2.5, 1.5);
-      vec2 z = vec2(cos(time / 10), sin(time / 10));
-      int limit = 16;
-      int i = 0;
-      for (i = 0; i < limit; ++i) {
-        if (z.x * z.x + z.y * z.y >= 4.0) {
-          break;
-        }
-        z = vec2(z.x*z.x - z.y*z.y, 2.*z.x*z.y) + c;
-      }
-      float x = float(i) / float(limit) * (ncolors-1);
-      int il = int(x) % ncolors;
-      float w = x - il;
-      fragColor = vec4(colors[il] * (1.0-w) + colors[(il+1)] * w, 1.0);
-    }
-    ''').lstrip()
-  fragment.attach_to(scene.root)
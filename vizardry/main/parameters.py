@@ -0,0 +1,249 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+"""
+wxPython controls for the parameter types in #vizardry.core.parameters.
+"""
+
+import wx
+from vizardry.core.parameters import Number, Text
+
+_factories = {}
+
+
+def control_factory(param_class):
+  """
+  Decorator for a #ParameterControl subclass (or a function that returns
+  one) which is called with a parameter and the parent window. The factory
+  is used for instances of *param_class* and its subclasses.
+  """
+
+  def decorator(factory):
+    _factories[param_class] = factory
+    return factory
+  return decorator
+
+
+def create_control(param, parent):
+  """
+  Creates the control for the #Parameter *param*. Falls back to
+  #Parameter.create_control() if no factory is registered for the type.
+  """
+
+  for cls in type(param).__mro__:
+    if cls in _factories:
+      return _factories[cls](param, parent).window
+  return param.create_control(parent)
+
+
+def create_panel(params, parent):
+  """
+  Creates a #VirtualParameterPanel for the parameters in the #Parameters
+  collection *params*. The controls are created once they are scrolled into
+  view.
+  """
+
+  return VirtualParameterPanel(parent, params)
+
+
+class VirtualParameterPanel(wx.ScrolledWindow):
+  """
+  A scrolled panel that creates the controls of its parameters only when
+  they are scrolled into view. Until then, every parameter is represented
+  by its label and a placeholder of the estimated size of its control.
+  """
+
+  def __init__(self, parent, params):
+    super().__init__(parent, style=wx.VSCROLL)
+    self.SetScrollRate(0, 10)
+    self._pending = []
+
+    sizer = wx.BoxSizer(wx.VERTICAL)
+    for param in params:
+      row = wx.Panel(self)
+      row_sizer = wx.BoxSizer(wx.VERTICAL)
+      row_sizer.Add(wx.StaticText(row, label=param.label), 0)
+      placeholder = wx.Panel(row, size=(-1, estimate_height(param)))
+      row_sizer.Add(placeholder, 0, wx.EXPAND)
+      row.SetSizer(row_sizer)
+      sizer.Add(row, 0, wx.EXPAND)
+      self._pending.append((row, param, placeholder))
+    self.SetSizer(sizer)
+
+    self.Bind(wx.EVT_SCROLLWIN, self.__on_scroll)
+    self.Bind(wx.EVT_SIZE, self.__on_size)
+    wx.CallAfter(self.realize_visible)
+
+  def __on_scroll(self, ev):
+    ev.Skip()
+    # The scroll position is updated after the event was processed.
+    wx.CallAfter(self.realize_visible)
+
+  def __on_size(self, ev):
+    ev.Skip()
+    wx.CallAfter(self.realize_visible)
+
+  def realize_visible(self):
+    """
+    Create the controls for all parameters that are currently visible.
+    """
+
+    if not self or not self._pending:
+      return
+
+    top = self.GetViewStart()[1] * self.GetScrollPixelsPerUnit()[1]
+    bottom = top + self.GetClientSize().height
+    pending = []
+    for row, param, placeholder in self._pending:
+      y = self.CalcUnscrolledPosition(row.GetPosition()).y
+      if y + row.GetSize().height < top or y > bottom:
+        pending.append((row, param, placeholder))
+        continue
+      control = create_control(param, row)
+      row.GetSizer().Replace(placeholder, control)
+      placeholder.Destroy()
+      row.Layout()
+
+    if len(pending) != len(self._pending):
+      self._pending = pending
+      self.Layout()
+      self.FitInside()
+
+
+def estimate_height(param):
+  """
+  Returns the estimated height in pixels of the control for *param*.
+  """
+
+  if isinstance(param, Text) and param.multiline:
+    return 120
+  return 28
+
+
+class ParameterControl:
+  """
+  Base class for parameter controls. Subclasses create the #window in
+  their constructor and implement #sync() which updates the widgets from
+  the parameter value. The parameter calls #sync() whenever its value
+  changes, until the window is destroyed.
+  """
+
+  def __init__(self, param, window):
+    self.param = param
+    self.window = window
+    param._control = self
+    window.Bind(wx.EVT_WINDOW_DESTROY, self.__destroyed)
+
+  def __destroyed(self, ev):
+    ev.Skip()
+    if ev.GetEventObject() is self.window and self.param._control is self:
+      self.param._control = None
+
+  def sync(self):
+    pass
+
+
+@control_factory(Text)
+class TextControl(ParameterControl):
+
+  def __init__(self, param, parent):
+    style = 0
+    if param.multiline:
+      style |= wx.TE_MULTILINE|wx.TE_DONTWRAP
+    if param.syntax:
+      style |= wx.TE_RICH2
+
+    widget = wx.TextCtrl(parent, style=style)
+
+    if param.syntax:
+      # TODO: Somehow to syntax highlighting (pygments and RTF?)
+      widget.SetFont(
+        wx.Font(10, wx.FONTFAMILY_TELETYPE, wx.FONTSTYLE_NORMAL,
+          wx.FONTWEIGHT_NORMAL, False, 'DejaVu Sans Mono'))
+
+    widget.SetValue(param.get_value())
+    widget.Bind(wx.EVT_KILL_FOCUS, self.__on_kill_focus)
+    widget.Bind(wx.EVT_CHAR_HOOK, self.__on_key)
+    super().__init__(param, widget)
+
+  def __on_key(self, ev):
+    if ev.GetKeyCode() == wx.WXK_RETURN:
+      if not self.param.multiline or wx.GetKeyState(wx.WXK_CONTROL):
+        self.param.commit(self.window.GetValue())
+        return
+    ev.Skip()
+
+  def __on_kill_focus(self, ev):
+    ev.Skip()
+    new_value = self.window.GetValue()
+    if new_value != self.param.get_value():
+      self.param.commit(new_value)
+
+  def sync(self):
+    value = self.param.get_value()
+    if self.window.GetValue() != value:
+      self.window.SetValue(value)
+
+
+@control_factory(Number)
+class NumberControl(ParameterControl):
+
+  def __init__(self, param, parent):
+    panel = wx.Panel(parent)
+    sizer = wx.BoxSizer(wx.HORIZONTAL)
+
+    inf = float('inf')
+    lo = -inf if param.min is None else param.min
+    hi = inf if param.max is None else param.max
+    self.spin = wx.SpinCtrlDouble(panel, min=lo, max=hi,
+      inc=1.0 if param.integer else 0.1)
+    self.spin.SetDigits(0 if param.integer else 3)
+    self.spin.Bind(wx.EVT_SPINCTRLDOUBLE, self.__on_spin)
+    sizer.Add(self.spin, 0)
+    if param.degree:
+      sizer.Add(wx.StaticText(panel, label='°'), 0, wx.ALIGN_CENTER_VERTICAL)
+
+    self.slider = None
+    lo, hi = param.slider_range
+    if param.slider and lo is not None and hi is not None:
+      self.slider = wx.Slider(panel, minValue=0, maxValue=1000)
+      self.slider.Bind(wx.EVT_SLIDER, self.__on_slider)
+      sizer.Add(self.slider, 1, wx.EXPAND)
+
+    panel.SetSizer(sizer)
+    super().__init__(param, panel)
+    self.sync()
+
+  def __on_spin(self, ev):
+    self.param.commit(self.spin.GetValue())
+
+  def __on_slider(self, ev):
+    lo, hi = self.param.slider_range
+    self.param.commit(lo + (hi - lo) * self.slider.GetValue() / 1000.0)
+
+  def sync(self):
+    value = self.param.get_value()
+    self.spin.SetValue(value)
+    if self.slider:
+      lo, hi = self.param.slider_range
+      self.slider.SetValue(int((value - lo) / (hi - lo) * 1000) if hi > lo else 0)
+    # Animated values are changed with keyframes, not with the widgets.
+    self.window.Enable(not self.param.animated)
@@ -76,4 +76,34 @@ class Viewport(wx.Panel):
       menu.AppendSeparator()
     menu.Append(1, '&Save as Image ...')
     sel = self.GetPopupMenuSelectionFromUser(menu)
-    # TODO: Implement Save as Image ...
+    if sel == 1:
+      self.__save_as_image()
+
+  def __save_as_image(self):
+    dialog = wx.FileDialog(self, 'Save as Image', wildcard='PNG files (*.png)|*.png',
+      style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+    if dialog.ShowModal() != wx.ID_OK:
+      return
+    size = self.canvas.GetClientSize()
+    pixels = self.render_image(size.width, size.height)
+    image = wx.Image(size.width, size.height, pixels[..., :3].tobytes(),
+      pixels[..., 3].tobytes())
+    if not image.SaveFile(dialog.GetPath(), wx.BITMAP_TYPE_PNG):
+      wx.MessageBox('Could not save image.', 'Save as Image', wx.ICON_ERROR)
+
+  def render_image(self, width, height):
+    """
+    Renders the scene offscreen at the specified resolution and returns
+    the image as a NumPy array of shape `(height, width, 4)` with the top
+    row first.
+    """
+
+    with self.as_current():
+      target = gl.RenderTarget(width, height)
+      try:
+        target.render(self.scene)
+        pixels = target.read()
+      finally:
+        target.release()
+    self.canvas.Refresh(False)
+    return pixels[::-1]
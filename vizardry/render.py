@@ -0,0 +1,285 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2018 Niklas Rosenstein
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to
+# deal in the Software without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+# sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+# IN THE SOFTWARE.
+
+
+"""
+Renders a scene to image files without a window, using an offscreen
+software OpenGL context (OSMesa or EGL).
+
+    $ vizardry render --size 1280x720 --start 0 --end 249 -o 'out/{frame:05d}.png'
+
+The scene is built by the `build_scene(scene)` function of the Python
+script passed as an argument, or is the default scene if no script is
+passed. For frame *n*, the scene time is `n / fps`, thus every frame
+renders the same regardless of the time it takes to render. With
+`--shard INDEX/COUNT`, only the INDEX-th of COUNT contiguous parts of the
+frame range is rendered, to split a range across processes or machines.
+
+Note that the OpenGL platform must be selected before PyOpenGL is imported
+for the first time, thus this module imports the rest of Vizardry lazily.
+"""
+
+import argparse
+import ctypes
+import os
+import runpy
+import struct
+import sys
+import zlib
+
+
+def shard_frames(start, end, index, count):
+  """
+  Returns the #range of frames of the *index*-th of *count* contiguous
+  shards of the frame range from *start* to *end* (inclusive).
+  """
+
+  if count < 1 or not 0 <= index < count:
+    raise ValueError('invalid shard {}/{}'.format(index, count))
+  total = max(0, end - start + 1)
+  size, remainder = divmod(total, count)
+  first = start + index * size + min(index, remainder)
+  last = first + size + (1 if index < remainder else 0)
+  return range(first, last)
+
+
+def write_png(filename, pixels):
+  """
+  Writes a NumPy array of shape `(height, width, 4)` and dtype uint8 with
+  the top row first to a PNG file.
+  """
+
+  height, width, channels = pixels.shape
+  if channels != 4 or pixels.dtype.itemsize != 1:
+    raise ValueError('expected RGBA8 pixels')
+
+  def chunk(kind, data):
+    crc = zlib.crc32(kind + data) & 0xffffffff
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', crc)
+
+  # Every scanline starts with the filter type byte (0 = None).
+  rows = bytearray()
+  for row in pixels:
+    rows.append(0)
+    rows.extend(row.tobytes())
+  header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+  with open(filename, 'wb') as fp:
+    fp.write(b'\x89PNG\r\n\x1a\n')
+    fp.write(chunk(b'IHDR', header))
+    fp.write(chunk(b'IDAT', zlib.compress(bytes(rows), 6)))
+    fp.write(chunk(b'IEND', b''))
+
+
+def write_raw(filename, pixels):
+  """
+  Writes the pixels of an array of shape `(height, width, 4)` as raw
+  RGBA8 data, top row first.
+  """
+
+  with open(filename, 'wb') as fp:
+    fp.write(pixels.tobytes())
+
+
+class OSMesaContext:
+  """
+  A core profile OpenGL context rendering into main memory with OSMesa.
+  Requires `PYOPENGL_PLATFORM=osmesa`.
+  """
+
+  def __init__(self, width, height):
+    from OpenGL import arrays, osmesa
+    from OpenGL.GL import GL_UNSIGNED_BYTE
+    attribs = [
+      osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+      osmesa.OSMESA_DEPTH_BITS, 24,
+      osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+      osmesa.OSMESA_CONTEXT_MAJOR_VERSION, 3,
+      osmesa.OSMESA_CONTEXT_MINOR_VERSION, 3,
+      0]
+    self._osmesa = osmesa
+    self._context = osmesa.OSMesaCreateContextAttribs(attribs, None)
+    if not self._context:
+      raise RuntimeError('OSMesaCreateContextAttribs() failed')
+    self._buffer = arrays.GLubyteArray.zeros((height, width, 4))
+    if not osmesa.OSMesaMakeCurrent(self._context, self._buffer, GL_UNSIGNED_BYTE, width, height):
+      raise RuntimeError('OSMesaMakeCurrent() failed')
+
+  def release(self):
+    if self._context:
+      self._osmesa.OSMesaDestroyContext(self._context)
+      self._context = None
+
+
+class EGLContext:
+  """
+  A core profile OpenGL context on a pbuffer surface with EGL, which
+  works without a display server. Requires `PYOPENGL_PLATFORM=egl`.
+  """
+
+  def __init__(self, width, height):
+    from OpenGL import EGL
+    self._egl = EGL
+    self._display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+    major, minor = EGL.EGLint(), EGL.EGLint()
+    if not EGL.eglInitialize(self._display, ctypes.pointer(major), ctypes.pointer(minor)):
+      raise RuntimeError('eglInitialize() failed')
+
+    def attrib_list(*values):
+      return (EGL.EGLint * (len(values) + 1))(*values, EGL.EGL_NONE)
+
+    config = EGL.EGLConfig()
+    num_configs = EGL.EGLint()
+    config_attribs = attrib_list(
+      EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+      EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+      EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8,
+      EGL.EGL_ALPHA_SIZE, 8, EGL.EGL_DEPTH_SIZE, 24)
+    if not EGL.eglChooseConfig(self._display, config_attribs, ctypes.pointer(config), 1,
+        ctypes.pointer(num_configs)) or num_configs.value < 1:
+      raise RuntimeError('eglChooseConfig() failed')
+
+    self._surface = EGL.eglCreatePbufferSurface(self._display, config,
+      attrib_list(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height))
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    self._context = EGL.eglCreateContext(self._display, config, EGL.EGL_NO_CONTEXT,
+      attrib_list(
+        EGL.EGL_CONTEXT_MAJOR_VERSION, 3,
+        EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+        EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT))
+    if not self._context:
+      raise RuntimeError('eglCreateContext() failed')
+    if not EGL.eglMakeCurrent(self._display, self._surface, self._surface, self._context):
+      raise RuntimeError('eglMakeCurrent() failed')
+
+  def release(self):
+    if self._context:
+      EGL = self._egl
+      EGL.eglMakeCurrent(self._display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+      EGL.eglDestroyContext(self._display, self._context)
+      EGL.eglDestroySurface(self._display, self._surface)
+      EGL.eglTerminate(self._display)
+      self._context = None
+
+
+CONTEXTS = {'osmesa': OSMesaContext, 'egl': EGLContext}
+
+
+def get_argument_parser(prog=None):
+  parser = argparse.ArgumentParser(prog=prog, description='Renders a scene '
+    'to image files with an offscreen software OpenGL context.')
+  parser.add_argument('script', nargs='?', help='A Python script that defines '
+    'a build_scene(scene) function. Renders the default scene if omitted.')
+  parser.add_argument('-o', '--output', default='frame_{frame:05d}.png',
+    help='The output filename pattern, formatted with the frame number as '
+    '"frame". Default: %(default)s')
+  parser.add_argument('--format', choices=('png', 'raw'), default='png',
+    help='The output format. "raw" writes RGBA8 pixels, top row first.')
+  parser.add_argument('--size', default='800x600', help='The frame size in '
+    'pixels. Default: %(default)s')
+  parser.add_argument('--start', type=int, default=0, help='The first frame.')
+  parser.add_argument('--end', type=int, default=0, help='The last frame (inclusive).')
+  parser.add_argument('--fps', type=float, default=25.0, help='The frame rate '
+    'that the scene time is computed from. Default: %(default)s')
+  parser.add_argument('--shard', default='0/1', help='Render only the INDEX-th '
+    'of COUNT parts of the frame range, formatted as INDEX/COUNT.')
+  default_backend = os.environ.get('PYOPENGL_PLATFORM')
+  if default_backend not in CONTEXTS:
+    default_backend = 'egl'
+  parser.add_argument('--backend', choices=sorted(CONTEXTS), default=default_backend,
+    help='The OpenGL context to create. Default: %(default)s')
+  return parser
+
+
+def render(scene, frames, width, height, fps, output, writer, log=None):
+  """
+  Renders the *frames* of the *scene* and passes every image to the
+  *writer* function together with the filename formatted from *output*.
+  An OpenGL context must be current.
+  """
+
+  from vizardry import gl
+
+  target = gl.RenderTarget(width, height)
+  readback = gl.AsyncReadback(target)
+  def write(result):
+    frame, pixels = result
+    filename = output.format(frame=frame)
+    writer(filename, pixels[::-1])
+    if log:
+      log('wrote {}'.format(filename))
+  try:
+    for frame in frames:
+      scene.frame = frame
+      scene.time = frame / fps
+      scene.delta_time = 1.0 / fps
+      scene.flush_events()
+      target.render(scene)
+      result = readback.start(frame)
+      if result:
+        write(result)
+    for result in readback.finish():
+      write(result)
+  finally:
+    target.release()
+    scene.gl_cleanup()
+
+
+def main(argv=None, prog=None):
+  parser = get_argument_parser(prog)
+  args = parser.parse_args(argv)
+
+  try:
+    width, height = map(int, args.size.lower().split('x'))
+    index, count = map(int, args.shard.split('/'))
+    frames = shard_frames(args.start, args.end, index, count)
+  except ValueError as exc:
+    parser.error(str(exc))
+
+  # Must happen before PyOpenGL is imported.
+  os.environ['PYOPENGL_PLATFORM'] = args.backend
+  if args.backend == 'egl':
+    # Lets Mesa create a context without a display server.
+    os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+  if 'OpenGL' in sys.modules:
+    parser.error('PyOpenGL was imported before the platform could be selected')
+
+  from vizardry.core.scene import Scene
+  context = CONTEXTS[args.backend](width, height)
+  try:
+    scene = Scene()
+    if args.script:
+      runpy.run_path(args.script)['build_scene'](scene)
+    else:
+      from vizardry.behaviours.defaults import add_default_nodes
+      add_default_nodes(scene)
+    directory = os.path.dirname(args.output)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    writer = write_png if args.format == 'png' else write_raw
+    log = lambda msg: print(msg, file=sys.stderr)
+    render(scene, frames, width, height, args.fps, args.output, writer, log)
+  finally:
+    context.release()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())